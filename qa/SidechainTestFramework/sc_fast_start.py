@@ -0,0 +1,150 @@
+"""
+Opt-in fast start profile of the SC nodes (--scfaststart): the JVM of every node maps a class data sharing archive
+(AppCDS) of the classes loaded by the application, instead of loading and verifying them from the jars, and runs
+with JIT/heap flags suited to short runs (DEFAULT_JVM_FLAGS, --scjvmflags).
+
+The archive is built once per classpath and cached in cache/appcds, keyed by the java version and the path, size
+and modification time of every jar, so it is built again when a jar changes. Building it takes a training run of
+a node recording the classes it loads (-XX:DumpLoadedClassList), then a dump (-Xshare:dump), see
+scutil.build_sc_fast_start_archive. JVMs without AppCDS for application classes (before Java 10) only get the
+flags; Java 10 needs -XX:+UseAppCDS to archive them, later versions do it by default. The archive is dumped with
+the same JVM flags the nodes run with, as a mismatch (e.g. of the GC) would make it unusable. Nodes started with
+the profile still work when the archive can't be used: -Xshare:auto falls back to the jars.
+"""
+
+import glob
+import hashlib
+import os
+import re
+import subprocess
+import sys
+
+DEFAULT_JVM_FLAGS = "-XX:TieredStopAtLevel=1 -XX:+UseSerialGC -Xms256m"
+APPCDS_MIN_JAVA_VERSION = 10
+# Before this version application classes are archived only with -XX:+UseAppCDS
+APPCDS_DEFAULT_JAVA_VERSION = 11
+
+
+def classpath_separator():
+    return ";" if sys.platform.startswith('win') else ":"
+
+
+def expand_classpath(classpath):
+    """
+    Return the entries of classpath, separated by the separator of the platform (":" would split Windows drive
+    letters), wildcards replaced by the jars they match in a stable order: the classpath of the nodes must be the
+    one the archive was built with.
+    """
+    entries = []
+    for entry in classpath.split(classpath_separator()):
+        if entry.endswith("*"):
+            entries.extend(sorted(glob.glob(entry[:-1] + "*.jar")))
+        elif entry:
+            entries.append(entry)
+    return entries
+
+
+class FastStartProfile(object):
+
+    def __init__(self, jvm_flags=None, cache_dir=None):
+        self.jvm_flags = (jvm_flags if jvm_flags is not None else DEFAULT_JVM_FLAGS).split()
+        self.cache_dir = cache_dir if cache_dir is not None else os.path.join("cache", "appcds")
+        self.__java_version = None
+
+    def java_version(self):
+        """
+        Return the output of java -version, and the major version (8 for "1.8.0_252", 11 for "11.0.7").
+        """
+        if self.__java_version is None:
+            output = subprocess.Popen(["java", "-version"], stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT).communicate()[0].decode('utf8', 'replace')
+            match = re.search(r'version "(\d+)(?:\.(\d+))?', output)
+            major = 0
+            if match:
+                major = int(match.group(2)) if match.group(1) == "1" else int(match.group(1))
+            self.__java_version = (output, major)
+        return self.__java_version
+
+    def supports_appcds(self):
+        return self.java_version()[1] >= APPCDS_MIN_JAVA_VERSION
+
+    def _appcds_flags(self):
+        return ["-XX:+UseAppCDS"] if self.java_version()[1] < APPCDS_DEFAULT_JAVA_VERSION else []
+
+    def _paths(self, classpath):
+        """
+        Return the class list and archive paths of classpath, and the prefix of their names
+        """
+        jars = expand_classpath(classpath)
+        key = hashlib.sha1(self.java_version()[0].encode('utf8'))
+        for jar in jars:
+            stat = os.stat(jar)
+            key.update(("%s %d %d\n" % (os.path.abspath(jar), stat.st_size, int(stat.st_mtime))).encode('utf8'))
+        prefix = hashlib.sha1(classpath.encode('utf8')).hexdigest()[:12] + "-"
+        name = os.path.join(self.cache_dir, prefix + key.hexdigest()[:12])
+        return name + ".classlist", name + ".jsa", prefix
+
+    def archive(self, classpath):
+        """
+        Return the path of the archive of classpath if it is built and up to date, None otherwise.
+        """
+        if not self.supports_appcds():
+            return None
+        archive = self._paths(classpath)[1]
+        return archive if os.path.isfile(archive) else None
+
+    def needs_archive(self, classpath):
+        return self.supports_appcds() and self.archive(classpath) is None
+
+    def java_command(self, classpath, main_class, args, training=False):
+        """
+        Return the command starting main_class with the profile; a training run records the loaded classes.
+        """
+        command = ["java"] + self.jvm_flags
+        if self.supports_appcds():
+            classlist, archive, _ = self._paths(classpath)
+            command += self._appcds_flags()
+            if training:
+                if not os.path.isdir(self.cache_dir):
+                    os.makedirs(self.cache_dir)
+                command += ["-Xshare:off", "-XX:DumpLoadedClassList=" + classlist]
+            elif os.path.isfile(archive):
+                command += ["-Xshare:auto", "-XX:SharedArchiveFile=" + archive]
+        return command + ["-cp", classpath_separator().join(expand_classpath(classpath)), main_class] + args
+
+    def dump_archive(self, classpath):
+        """
+        Build the archive of classpath from the class list of a training run, removing its outdated archives.
+        """
+        classlist, archive, prefix = self._paths(classpath)
+        with open(os.devnull, "w") as devnull:
+            subprocess.check_call(["java"] + self.jvm_flags + self._appcds_flags() +
+                                  ["-Xshare:dump", "-XX:SharedClassListFile=" + classlist,
+                                   "-XX:SharedArchiveFile=" + archive,
+                                   "-cp", classpath_separator().join(expand_classpath(classpath))],
+                                  stdout=devnull, stderr=devnull)
+        for path in glob.glob(os.path.join(self.cache_dir, prefix + "*")):
+            if path not in (classlist, archive):
+                os.remove(path)
+        return archive
+
+
+_shared_profile = None
+
+
+def enable_fast_start(jvm_flags=None, cache_dir=None):
+    global _shared_profile
+    _shared_profile = FastStartProfile(jvm_flags, cache_dir)
+    return _shared_profile
+
+
+def disable_fast_start():
+    global _shared_profile
+    _shared_profile = None
+
+
+def get_fast_start():
+    """
+    Return the fast start profile of the SC nodes started by the framework, None if it is not enabled.
+    """
+    return _shared_profile
@@ -5,13 +5,18 @@ from SidechainTestFramework.sc_boostrap_info import SCNetworkConfiguration, SCBo
 from test_framework.test_framework import BitcoinTestFramework
 from test_framework.authproxy import JSONRPCException
 from SidechainTestFramework.sidechainauthproxy import SCAPIException
+from test_framework.responsecache import enable_response_cache, get_response_cache
+from test_framework.traffic import enable_recording, enable_replay, get_traffic
+from test_framework.callstats import CALL_STATS, WAIT_STATS
+from test_framework.wait import set_max_delay
+from SidechainTestFramework.sc_fast_start import enable_fast_start, DEFAULT_JVM_FLAGS
 from test_framework.util import check_json_precision, \
     initialize_chain_clean, \
     start_nodes, stop_nodes, \
     sync_blocks, sync_mempools, wait_bitcoinds, websocket_port_by_mc_node_index
 from SidechainTestFramework.scutil import initialize_default_sc_chain_clean, \
     start_sc_nodes, stop_sc_nodes, \
-    sync_sc_blocks, sync_sc_mempools, TimeoutException, \
+    sync_sc_state, TimeoutException, \
     bootstrap_sidechain_nodes
 import os
 import traceback
@@ -87,13 +92,11 @@ class SidechainTestFramework(BitcoinTestFramework):
     def sc_split_network(self):
         pass
 
-    def sc_sync_all(self):
-        sync_sc_blocks(self.sc_nodes)
-        sync_sc_mempools(self.sc_nodes)
+    def sc_sync_all(self, tips=False):
+        sync_sc_state(self.sc_nodes, tips=tips)
 
-    def sc_sync_nodes(self, sc_nodes):
-        sync_sc_blocks(sc_nodes)
-        sync_sc_mempools(sc_nodes)
+    def sc_sync_nodes(self, sc_nodes, tips=False):
+        sync_sc_state(sc_nodes, tips=tips)
 
     def sc_join_network(self):
         pass
@@ -117,6 +120,26 @@ class SidechainTestFramework(BitcoinTestFramework):
                           help="Root directory for datadirs")
         parser.add_option("--tracerpc", dest="trace_rpc", default=False, action="store_true",
                           help="Print out all RPC calls as they are made")
+        parser.add_option("--apicachesize", dest="api_cache_size", default=0, type="int",
+                          help="Cache responses of content-addressed MC/SC API calls, up to this many MB "
+                               "(default: %default, disabled)")
+        parser.add_option("--recordtraffic", dest="record_traffic", default=None,
+                          help="Record all the traffic with the nodes to this file")
+        parser.add_option("--replaytraffic", dest="replay_traffic", default=None,
+                          help="Replay the traffic recorded to this file, without starting any node")
+        parser.add_option("--callstats", dest="call_stats", default=None,
+                          help="Dump the statistics of the MC/SC API calls to this JSON file")
+        parser.add_option("--waitstats", dest="wait_stats", default=None,
+                          help="Dump the statistics of the waits on the nodes (syncs, readiness) to this JSON file")
+        parser.add_option("--maxpolldelay", dest="max_poll_delay", default=None, type="float",
+                          help="Maximum delay in seconds between two checks of the sync and wait helpers "
+                               "(default: 0.5)")
+        parser.add_option("--scfaststart", dest="sc_fast_start", default=False, action="store_true",
+                          help="Start the SC nodes with a cached class data sharing archive and the JVM flags of "
+                               "--scjvmflags (see SidechainTestFramework/sc_fast_start.py)")
+        parser.add_option("--scjvmflags", dest="sc_jvm_flags", default=None,
+                          help="JVM flags of the SC nodes started with --scfaststart (default: \"%s\")"
+                               % DEFAULT_JVM_FLAGS)
 
         self.add_options(parser)
         self.sc_add_options(parser)
@@ -130,6 +153,17 @@ class SidechainTestFramework(BitcoinTestFramework):
 
         check_json_precision()
 
+        if self.options.max_poll_delay is not None:
+            set_max_delay(self.options.max_poll_delay)
+        if self.options.sc_fast_start:
+            enable_fast_start(self.options.sc_jvm_flags)
+        if self.options.api_cache_size > 0:
+            enable_response_cache(self.options.api_cache_size * 1024 * 1024)
+        if self.options.record_traffic:
+            enable_recording(self.options.record_traffic)
+        elif self.options.replay_traffic:
+            enable_replay(self.options.replay_traffic)
+
         success = False
         try:
             if not os.path.isdir(self.options.tmpdir):
@@ -156,7 +190,7 @@ class SidechainTestFramework(BitcoinTestFramework):
             print("SCAPI error: "+e.error)
             traceback.print_tb(sys.exc_info()[2])
         except TimeoutException as e:
-            print("Timeout while: " + e.operation) #Timeout for SC Operations
+            print("Timeout while: " + str(e)) #Timeout for SC Operations
             traceback.print_tb(sys.exc_info()[2])
         except AssertionError as e:
             print("Assertion failed: "+e.message)
@@ -180,6 +214,28 @@ class SidechainTestFramework(BitcoinTestFramework):
             print("Cleaning up")
             shutil.rmtree(self.options.tmpdir)
 
+        if CALL_STATS.summary():
+            print("API calls:")
+            print(CALL_STATS.format_table())
+            if self.options.call_stats:
+                CALL_STATS.dump(self.options.call_stats)
+
+        if WAIT_STATS.summary():
+            print("Waits on the nodes:")
+            print(WAIT_STATS.format_table())
+            if self.options.wait_stats:
+                WAIT_STATS.dump(self.options.wait_stats)
+
+        traffic = get_traffic()
+        if traffic is not None:
+            print("Traffic file {0}: {1} requests".format(traffic.path, traffic.records))
+            traffic.close()
+
+        response_cache = get_response_cache()
+        if response_cache is not None:
+            print("API response cache: {hits} hits, {misses} misses, {evictions} evictions, "
+                  "{invalidations} invalidations, {entries} entries, {bytes} bytes".format(**response_cache.stats()))
+
         if success:
             print("Test successful")
             sys.exit(0)
@@ -1,25 +1,27 @@
 import os
-import sys
 
 import json
 
 from SidechainTestFramework.sc_boostrap_info import MCConnectionInfo, SCBootstrapInfo, SCNetworkConfiguration, Account, \
     VrfAccount, CertificateProofInfo, SCNodeConfiguration
-from sidechainauthproxy import SidechainAuthServiceProxy
+from sidechainauthproxy import SidechainAuthServiceProxy, SCAPIException
+import shutil
 import subprocess
-import time
 import socket
-from contextlib import closing
+import time
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
 
 from test_framework.util import initialize_new_sidechain_in_mainchain
-
-WAIT_CONST = 1
-
-
-class TimeoutException(Exception):
-    def __init__(self, operation):
-        Exception.__init__(self)
-        self.operation = operation
+from test_framework.responsecache import get_response_cache
+from test_framework.traffic import get_traffic, is_replaying
+from test_framework.deadline import within
+from test_framework.callstats import WAIT_STATS
+from SidechainTestFramework.sc_fast_start import get_fast_start, classpath_separator
+from test_framework.wait import wait_until, wait_for_agreement, wait_for_same_ids, poll_concurrently, \
+    TimeoutException
 
 
 def sc_p2p_port(n):
@@ -35,72 +37,190 @@ def wait_for_next_sc_blocks(node, expected_height, wait_for=25):
     """
     Wait until blockchain height won't reach the expected_height, for wait_for seconds
     """
-    start = time.time()
-    while True:
-        if time.time() - start >= wait_for:
-            raise TimeoutException("Waiting blocks")
-        height = int(node.block_best()["result"]["height"])
-        if height >= expected_height:
-            break
-        time.sleep(WAIT_CONST)
+    return wait_until(lambda: int(node.block_best()["result"]["height"]) >= expected_height, wait_for,
+                      "Waiting blocks")
+
+
+class SCNodeExitedException(Exception):
+    def __init__(self, node_num, returncode, stderr_tail):
+        message = "SC node{0} exited with code {1} while starting".format(node_num, returncode)
+        if stderr_tail is None:
+            message += ", its stderr was not captured (start the nodes with print_output_to_file to get it)"
+        elif stderr_tail:
+            message += ", end of its stderr:\n" + stderr_tail
+        else:
+            message += ", nothing written to its stderr"
+        Exception.__init__(self, message)
+        self.node_num = node_num
+        self.returncode = returncode
+        self.stderr_tail = stderr_tail
 
 
-def wait_for_sc_node_initialization(nodes):
+def sc_node_stderr_tail(i, lines=20):
     """
-    Wait for SC Nodes to be fully initialized. This is done by pinging a node until its socket will be fully open
+    Return the last lines of the stderr of SC node i, None if it is not written to a file (print_output_to_file)
     """
-    for i in range(len(nodes)):
-        rpc_port = sc_rpc_port(i)
-        with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
-            while not sock.connect_ex(("127.0.0.1", rpc_port)) == 0:
-                time.sleep(WAIT_CONST)
+    path = sidechainclient_stderr.get(i)
+    if path is None or not os.path.isfile(path):
+        return None
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 16384))
+        return b"\n".join(f.read().splitlines()[-lines:]).decode('utf8', 'replace')
 
 
-def sync_sc_blocks(api_connections, wait_for=25, p=False):
+def wait_for_sc_node_initialization(nodes, wait_for=120, since=None):
     """
-    Wait for maximum wait_for seconds for everybody to have the same block count
+    Wait for SC Nodes to be fully initialized: their API is probed concurrently until it answers, failing as soon
+    as a node process exits. Return the time to ready of every node since they were launched (since, default now),
+    also recorded as "READY SC node".
     """
-    start = time.time()
-    while True:
-        if time.time() - start >= wait_for:
-            raise TimeoutException("Syncing blocks")
-        counts = [int(x.block_best()["result"]["height"]) for x in api_connections]
+    if is_replaying():
+        return []
+    start = since if since is not None else time.time()
+    ready = [None] * len(nodes)
+
+    def probe(i):
+        if ready[i] is not None:
+            return True
+        returncode = check_sc_node(i) if i in sidechainclient_processes else None
+        if returncode is not None:
+            raise SCNodeExitedException(i, returncode, sc_node_stderr_tail(i))
+        try:
+            nodes[i].node_connectedPeers()
+        except (socket.error, httplib.HTTPException, SCAPIException):
+            # Not listening yet, or API not started
+            return False
+        ready[i] = time.time() - start
+        WAIT_STATS.record("READY SC node", ready[i])
+        return True
+    wait_until(lambda: all(poll_concurrently(probe, list(range(len(nodes))))), wait_for, "Initializing SC nodes")
+    return ready
+
+
+def get_sc_tip(node):
+    """
+    Return the id of the best block of a SC node, a few bytes instead of the whole best block
+    """
+    return node.block_findLastIds(number=1)["result"]["lastBlockIds"][0]
+
+
+def _describe_sc_tips(api_connections, tips):
+    """
+    Tell where every node is, fetching their best blocks: used only once tips have been found to diverge, or tips is
+    None if the wait gave up before reading all of them
+    """
+    bests = poll_concurrently(lambda x: x.block_best()["result"], api_connections)
+    heights = [int(best["height"]) for best in bests]
+    if tips is None:
+        tips = [best["block"]["id"] for best in bests]
+    lines = []
+    for i, best in enumerate(bests):
+        line = "node{0} at height {1} on {2}".format(i, heights[i], best["block"]["id"])
+        if tips[i] != tips[0]:
+            line += " (fork of node0)" if heights[i] == heights[0] else \
+                " ({0} node0)".format("behind" if heights[i] < heights[0] else "ahead of")
+        lines.append(line)
+    return ", ".join(lines)
+
+
+def sync_sc_blocks(api_connections, wait_for=25, p=False, tips=False):
+    """
+    Wait for maximum wait_for seconds for everybody to have the same block count, querying the nodes concurrently.
+    With tips, wait for everybody to have the same best block instead: nodes on different forks at the same height
+    are not synced. Only the best block ids are read, the best blocks are fetched to tell where the nodes are if they
+    don't converge.
+    """
+    if tips:
+        values = {"tips": None}
+
+        def most_common(ids):
+            values["tips"] = ids
+            if p:
+                print (ids)
+            return max(set(ids), key=ids.count)
+        try:
+            return wait_for_agreement(api_connections, get_sc_tip, wait_for, "Syncing block tips", target=most_common)
+        except TimeoutException as e:
+            raise TimeoutException(e.operation, e.elapsed, _describe_sc_tips(api_connections, values["tips"]))
+
+    def highest(counts):
         if p:
             print (counts)
-        if counts == [counts[0]] * len(counts):
-            break
-        time.sleep(WAIT_CONST)
+        return max(counts)
+    return wait_for_agreement(api_connections, lambda x: int(x.block_best()["result"]["height"]), wait_for,
+                              "Syncing blocks", target=highest)
 
 
 def sync_sc_mempools(api_connections, wait_for=25):
     """
-    Wait for maximum wait_for seconds for everybody to have the same transactions in their memory pools
+    Wait for maximum wait_for seconds for everybody to have the same transactions in their memory pools, querying
+    the nodes concurrently. Only the transaction ids are read and compared as sets
     """
-    start = time.time()
-    while True:
-        refpool = api_connections[0].transaction_allTransactions()["result"]["transactions"]
-        if time.time() - start >= wait_for:
-            raise TimeoutException("Syncing mempools")
-        num_match = 1
-        for i in range(1, len(api_connections)):
-            nodepool = api_connections[i].transaction_allTransactions()["result"]["transactions"]
-            if cmp(nodepool, refpool) == 0:
-                num_match = num_match + 1
-        if num_match == len(api_connections):
-            break
-        time.sleep(WAIT_CONST)
+    return wait_for_same_ids(api_connections,
+                             lambda x: x.transaction_allTransactions(format=False)["result"]["transactionIds"],
+                             wait_for, "Syncing mempools", "transactions")
+
+
+def get_sc_node_snapshot(node, balance=True):
+    """
+    Read the state of a SC node used by the sync and check helpers in about one round trip, pipelining the requests:
+    best block, mempool transaction ids and, unless balance is False, wallet balance
+    """
+    requests = ["block_best", ("transaction_allTransactions", {"format": False})]
+    if balance:
+        requests.append("wallet_balance")
+    responses = node._multi_get(requests)
+    snapshot = {"height": int(responses[0]["result"]["height"]),
+                "best_block_id": responses[0]["result"]["block"]["id"],
+                "mempool": responses[1]["result"]["transactionIds"]}
+    if balance:
+        snapshot["balance"] = responses[2]["result"]["balance"]
+    return snapshot
+
+
+def sync_sc_state(api_connections, wait_for=25, tips=False):
+    """
+    Wait for maximum wait_for seconds for everybody to have the same block count and the same transactions in their
+    memory pools, querying the nodes concurrently. Each round reads both from a node in about one round trip (see
+    get_sc_node_snapshot). With tips, wait for everybody to have the same best block instead of the same block count.
+    """
+    def state(node):
+        snapshot = get_sc_node_snapshot(node, balance=False)
+        return snapshot["best_block_id"] if tips else snapshot["height"], frozenset(snapshot["mempool"])
+
+    def target(values):
+        if tips:
+            return max(values, key=values.count)
+        return max(values, key=lambda value: value[0])
+
+    def describe(value):
+        return "{0} with {1} mempool transactions".format(value[0], len(value[1]))
+    return wait_for_agreement(api_connections, state, wait_for, "Syncing blocks and mempools", target=target,
+                              describe=describe)
 
 
 sidechainclient_processes = {}
+sidechainclient_stderr = {}  # node num -> stderr file, if any
 
 
 
 def launch_bootstrap_tool(command_name, json_parameters):
     json_param = json.dumps(json_parameters)
-    java_ps = subprocess.Popen(["java", "-jar",
-                               os.getenv("SIDECHAIN_SDK", "..") + "/tools/sctool/target/sidechains-sdk-scbootstrappingtools-0.2.7.jar",
-                               command_name, json_param], stdout=subprocess.PIPE)
-    sc_bootstrap_output = java_ps.communicate()[0]
+
+    def run_bootstrap_tool():
+        java_ps = subprocess.Popen(["java", "-jar",
+                                   os.getenv("SIDECHAIN_SDK", "..") + "/tools/sctool/target/sidechains-sdk-scbootstrappingtools-0.2.7.jar",
+                                   command_name, json_param], stdout=subprocess.PIPE)
+        output = java_ps.communicate()[0]
+        return java_ps.returncode, output
+
+    traffic = get_traffic()
+    if traffic is not None:
+        # Recorded like a request to a node, so replays don't need Java
+        sc_bootstrap_output = traffic.exchange("sctool", "java", command_name, json_param, False, run_bootstrap_tool)[1]
+    else:
+        sc_bootstrap_output = run_bootstrap_tool()[1]
     jsone_node = json.loads(sc_bootstrap_output)
     return jsone_node
 
@@ -337,40 +457,106 @@ def get_websocket_configuration(index, array_of_MCConnectionInfo):
     return array_of_MCConnectionInfo[index] if index < len(array_of_MCConnectionInfo) else MCConnectionInfo()
 
 
+def sc_node_classpath(binary=None):
+    """
+    Return the classpath and main class of a SC node binary, "<classpath> <main class>"
+    """
+    if binary is None:
+        binary = "../examples/simpleapp/target/sidechains-sdk-simpleapp-0.2.7.jar" + classpath_separator() + "../examples/simpleapp/target/lib/* com.horizen.examples.SimpleApp"
+    classpath, main_class = binary.split()
+    return classpath, main_class
+
+
 def start_sc_node(i, dirname, extra_args=None, rpchost=None, timewait=None, binary=None, print_output_to_file=False):
     """
     Start a SC node and returns API connection to it
     """
     # Will we have  extra args for SC too ?
     datadir = os.path.join(dirname, "sc_node" + str(i))
-    lib_separator = ":"
-    if sys.platform.startswith('win'):
-        lib_separator = ";"
-
-    if binary is None:
-        binary = "../examples/simpleapp/target/sidechains-sdk-simpleapp-0.2.7.jar" + lib_separator + "../examples/simpleapp/target/lib/* com.horizen.examples.SimpleApp"
-    #        else if platform.system() == 'Linux':
-    bashcmd = 'java -cp ' + binary + " " + (datadir + ('/node%s.conf' % i))
-    if print_output_to_file:
-        with open(datadir + "/log_out.txt", "wb") as out, open(datadir + "/log_err.txt", "wb") as err:
-            sidechainclient_processes[i] = subprocess.Popen(bashcmd.split(), stdout=out, stderr=err)
+    classpath, main_class = sc_node_classpath(binary)
+    fast_start = get_fast_start()
+    if fast_start is not None:
+        command = fast_start.java_command(classpath, main_class, [datadir + ('/node%s.conf' % i)])
     else:
-        sidechainclient_processes[i] = subprocess.Popen(bashcmd.split())
+        command = ['java', '-cp', classpath, main_class, datadir + ('/node%s.conf' % i)]
+    if not is_replaying():
+        if print_output_to_file:
+            with open(datadir + "/log_out.txt", "wb") as out, open(datadir + "/log_err.txt", "wb") as err:
+                sidechainclient_processes[i] = subprocess.Popen(command, stdout=out, stderr=err)
+            sidechainclient_stderr[i] = datadir + "/log_err.txt"
+        else:
+            sidechainclient_processes[i] = subprocess.Popen(command)
 
     url = "http://rt:rt@%s:%d" % ('127.0.0.1' or rpchost, sc_rpc_port(i))
-    proxy = SidechainAuthServiceProxy(url)
+    proxy = SidechainAuthServiceProxy(url, cache=get_response_cache(), traffic=get_traffic())
     proxy.url = url  # store URL on proxy for info
     return proxy
 
 
+def build_sc_fast_start_archive(i, dirname, binary=None, wait_for=300):
+    """
+    Build the class data sharing archive of the fast start profile for the binary of SC node i (see
+    sc_fast_start.py): run the node on a copy of its datadir until its API answers, recording the classes it loads,
+    then dump them. The node must not be running. Return the build time.
+    """
+    fast_start = get_fast_start()
+    classpath, main_class = sc_node_classpath(binary)
+    start = time.time()
+    datadir = os.path.join(dirname, "sc_node" + str(i))
+    training_dir = datadir + "_training"
+    shutil.rmtree(training_dir, True)
+    shutil.copytree(datadir, training_dir)
+    conf = os.path.join(training_dir, "node%s.conf" % i)
+    with open(conf) as f:
+        config = f.read()
+    with open(conf, "w") as f:
+        f.write(config.replace(datadir + "/", training_dir + "/"))
+    proxy = SidechainAuthServiceProxy("http://rt:rt@127.0.0.1:%d" % sc_rpc_port(i))
+    with open(os.devnull, "w") as devnull:
+        process = subprocess.Popen(fast_start.java_command(classpath, main_class, [conf], training=True),
+                                   stdout=devnull, stderr=devnull)
+
+    def ready():
+        if process.poll() is not None:
+            raise SCNodeExitedException(i, process.returncode, None)
+        try:
+            proxy.node_connectedPeers()
+        except (socket.error, httplib.HTTPException, SCAPIException):
+            return False
+        return True
+    try:
+        wait_until(ready, wait_for, "Training SC fast start archive")
+    finally:
+        # Exit cleanly, writing the whole class list
+        if process.poll() is None:
+            process.terminate()
+        process.wait()
+        shutil.rmtree(training_dir, True)
+    fast_start.dump_archive(classpath)
+    elapsed = time.time() - start
+    print("SC fast start archive built in {0:.3f}s".format(elapsed))
+    return elapsed
+
+
 def start_sc_nodes(num_nodes, dirname, extra_args=None, rpchost=None, binary=None, print_output_to_file=False):
     """
-    Start multiple SC clients, return connections to them
+    Start multiple SC clients, return connections to them.
+    All the processes are launched first, then waited for concurrently.
     """
     if extra_args is None: extra_args = [None for i in range(num_nodes)]
     if binary is None: binary = [None for i in range(num_nodes)]
+    fast_start = get_fast_start()
+    if fast_start is not None and not is_replaying():
+        for i in range(num_nodes):
+            if fast_start.needs_archive(sc_node_classpath(binary[i])[0]):
+                build_sc_fast_start_archive(i, dirname, binary[i])
+    start = time.time()
     nodes = [start_sc_node(i, dirname, extra_args[i], rpchost, binary=binary[i], print_output_to_file=print_output_to_file) for i in range(num_nodes)]
-    wait_for_sc_node_initialization(nodes)
+    ready = wait_for_sc_node_initialization(nodes, since=start)
+    if ready:
+        print("SC nodes ready in {0:.3f}s{1}: {2}".format(max(ready), " (fast start)" if fast_start is not None else "",
+                                                        ", ".join("node{0} {1:.3f}s".format(i, ready[i])
+                                                                  for i in range(len(ready)))))
     return nodes
 
 
@@ -378,12 +564,16 @@ def check_sc_node(i):
     '''
     Check subprocess return code.
     '''
+    if is_replaying():
+        return None
     sidechainclient_processes[i].poll()
     return sidechainclient_processes[i].returncode
 
 
 def stop_sc_node(node, i):
     # Must be changed with a sort of .stop() API Call
+    if is_replaying():
+        return
     sidechainclient_processes[i].kill()
     del sidechainclient_processes[i]
 
@@ -418,14 +608,37 @@ def connect_sc_nodes(from_connection, node_num, wait_for=25):
     print("Connecting to " + ip_port)
     oldnum = len(from_connection.node_connectedPeers()["result"]["peers"])
     from_connection.node_connect(json.dumps(j))
+    return wait_until(lambda: len(from_connection.node_connectedPeers()["result"]["peers"]) == oldnum + 1, wait_for,
+                      "Trying to connect to node{0}".format(node_num))
+
+
+def connect_sc_topology(nodes, edges, wait_for=60):
+    """
+    Connect the SC nodes along edges, pairs (a, b) of node numbers: all the connections are requested concurrently,
+    then a single wait until every edge is confirmed on both ends (each node sees the other one, by its node name,
+    among its connected peers). Return the total connect time.
+    """
     start = time.time()
-    while True:
-        if time.time() - start >= wait_for:
-            raise (TimeoutException("Trying to connect to node{0}".format(node_num)))
-        newnum = len(from_connection.node_connectedPeers()["result"]["peers"])
-        if newnum == (oldnum + 1):
-            break
-        time.sleep(WAIT_CONST)
+
+    def request(edge):
+        a, b = edge
+        nodes[a].node_connect(json.dumps({"host": "127.0.0.1", "port": str(sc_p2p_port(b))}))
+    poll_concurrently(request, list(edges))
+    expected = dict((i, set()) for i in range(len(nodes)))
+    for (a, b) in edges:
+        expected[a].add("node{0}".format(b))
+        expected[b].add("node{0}".format(a))
+
+    def confirmed(i):
+        if not expected[i]:
+            return True
+        names = set(peer["name"] for peer in nodes[i].node_connectedPeers()["result"]["peers"])
+        return expected[i] <= names
+    wait_until(lambda: all(poll_concurrently(confirmed, list(range(len(nodes))))), wait_for,
+               "Connecting {0} SC node edges".format(len(edges)))
+    elapsed = time.time() - start
+    print("Connected {0} SC node edges in {1:.3f}s".format(len(edges), elapsed))
+    return elapsed
 
 
 def connect_sc_nodes_bi(nodes, a, b):
@@ -523,18 +736,22 @@ Parameters:
  - expected_balance: expected balance for that account
 """
 def check_box_balance(sc_node, account, box_type, expected_boxes_count, expected_balance):
-    response = sc_node.wallet_allBoxes()
-    boxes = response["result"]["boxes"]
+    # Boxes are streamed one by one: wallets may hold too many of them to decode the whole response at once
+    boxes = sc_node.wallet_allBoxes._stream("result.boxes")
     boxes_balance = 0
     boxes_count = 0
     pub_key = account.publicKey
-    for box in boxes:
-        if box["proposition"]["publicKey"] == pub_key and (box["typeId"] == box_type or box_type == 0):
-            box_value = box["value"]
-            assert_true(box_value > 0,
-                        "Non positive value for box: {0} with public key: {1}".format(box["id"], pub_key))
-            boxes_balance += box_value
-            boxes_count += 1
+    try:
+        for box in boxes:
+            if box["proposition"]["publicKey"] == pub_key and (box["typeId"] == box_type or box_type == 0):
+                box_value = box["value"]
+                assert_true(box_value > 0,
+                            "Non positive value for box: {0} with public key: {1}".format(box["id"], pub_key))
+                boxes_balance += box_value
+                boxes_count += 1
+    finally:
+        # Gives the connection back right away if the loop was left early
+        boxes.close()
 
     assert_equal(expected_boxes_count, boxes_count,
                 "Unexpected number of boxes for public key {0}. Expected {1} but found {2}."
@@ -676,7 +893,16 @@ def get_next_epoch_slot(epoch, slot, slots_in_epoch, force_switch_to_next_epoch=
     return next_epoch, next_slot
 
 
-def generate_next_block(node, node_name, force_switch_to_next_epoch=False):
+def generate_next_block(node, node_name, force_switch_to_next_epoch=False, deadline=None):
+    """
+    Forge the next SC block, skipping slots without forging stake. If deadline (seconds) is given, all the API calls
+    must complete within it.
+    """
+    with within(deadline, "generating a block on SC {0}".format(node_name)):
+        return _generate_next_block(node, node_name, force_switch_to_next_epoch)
+
+
+def _generate_next_block(node, node_name, force_switch_to_next_epoch):
     forging_info = node.block_forgingInfo()["result"]
     slots_in_epoch = forging_info["consensusSlotsInEpoch"]
     best_slot = forging_info["bestSlotNumber"]
@@ -700,8 +926,9 @@ def generate_next_block(node, node_name, force_switch_to_next_epoch=False):
     return forge_result["result"]["blockId"]
 
 
-def generate_next_blocks(node, node_name, blocks_count):
+def generate_next_blocks(node, node_name, blocks_count, deadline=None):
     blocks_ids = []
-    for i in range(blocks_count):
-        blocks_ids.append(generate_next_block(node, node_name))
+    with within(deadline, "generating {0} blocks on SC {1}".format(blocks_count, node_name)):
+        for i in range(blocks_count):
+            blocks_ids.append(generate_next_block(node, node_name))
     return blocks_ids
@@ -0,0 +1,89 @@
+from SidechainTestFramework.sidechainauthproxy import SidechainAuthServiceProxy, HTTP_TIMEOUT
+from test_framework.jsoncodec import DECIMAL_CODEC
+
+"""
+   SC REST API client with one precomputed method per route, built from the route table below.
+   Method names follow the SidechainAuthServiceProxy convention (block_findById -> POST /block/findById) and accept
+   the same arguments: a positional request body string or keyword arguments serialized to a JSON object.
+   Unlike the proxy, calling a route does not create a new proxy object nor parse the method name, so the per call
+   overhead is a method lookup plus the HTTP exchange. Names not in the table (e.g. application specific routes)
+   fall back to the proxy.
+
+   The table mirrors SidechainBlockApiRoute, SidechainWalletApiRoute, SidechainTransactionApiRoute,
+   SidechainNodeApiRoute and MainchainBlockApiRoute: keep it in sync when routes are added or removed there.
+"""
+
+# (method name, HTTP method, path)
+SIDECHAIN_API_ROUTES = (
+    # SidechainBlockApiRoute
+    ("block_findById", "POST", "/block/findById"),
+    ("block_findLastIds", "POST", "/block/findLastIds"),
+    ("block_findIdByHeight", "POST", "/block/findIdByHeight"),
+    ("block_best", "POST", "/block/best"),
+    ("block_startForging", "POST", "/block/startForging"),
+    ("block_stopForging", "POST", "/block/stopForging"),
+    ("block_generate", "POST", "/block/generate"),
+    ("block_forgingInfo", "POST", "/block/forgingInfo"),
+    # SidechainWalletApiRoute
+    ("wallet_allBoxes", "POST", "/wallet/allBoxes"),
+    ("wallet_balance", "POST", "/wallet/balance"),
+    ("wallet_createPrivateKey25519", "POST", "/wallet/createPrivateKey25519"),
+    ("wallet_createVrfSecret", "POST", "/wallet/createVrfSecret"),
+    ("wallet_allPublicKeys", "POST", "/wallet/allPublicKeys"),
+    # SidechainTransactionApiRoute
+    ("transaction_allTransactions", "POST", "/transaction/allTransactions"),
+    ("transaction_findById", "POST", "/transaction/findById"),
+    ("transaction_decodeTransactionBytes", "POST", "/transaction/decodeTransactionBytes"),
+    ("transaction_createCoreTransaction", "POST", "/transaction/createCoreTransaction"),
+    ("transaction_createCoreTransactionSimplified", "POST", "/transaction/createCoreTransactionSimplified"),
+    ("transaction_sendCoinsToAddress", "POST", "/transaction/sendCoinsToAddress"),
+    ("transaction_withdrawCoins", "POST", "/transaction/withdrawCoins"),
+    ("transaction_makeForgerStake", "POST", "/transaction/makeForgerStake"),
+    ("transaction_spendForgingStake", "POST", "/transaction/spendForgingStake"),
+    ("transaction_sendTransaction", "POST", "/transaction/sendTransaction"),
+    # SidechainNodeApiRoute
+    ("node_allPeers", "POST", "/node/allPeers"),
+    ("node_connectedPeers", "POST", "/node/connectedPeers"),
+    ("node_connect", "POST", "/node/connect"),
+    ("node_blacklistedPeers", "POST", "/node/blacklistedPeers"),
+    # MainchainBlockApiRoute
+    ("mainchain_bestBlockReferenceInfo", "POST", "/mainchain/bestBlockReferenceInfo"),
+    ("mainchain_genesisBlockReferenceInfo", "POST", "/mainchain/genesisBlockReferenceInfo"),
+    ("mainchain_blockReferenceInfoBy", "POST", "/mainchain/blockReferenceInfoBy"),
+    ("mainchain_blockReferenceByHash", "POST", "/mainchain/blockReferenceByHash"),
+)
+
+
+def _route_method(name, http_method, path):
+    def call(self, *args, **kwargs):
+        if kwargs:
+            postdata = self._encode(kwargs)
+        elif args:
+            postdata = args[0]
+        else:
+            postdata = None
+        return self._request(http_method, path, postdata)
+    call.__name__ = name
+    call.__doc__ = "%s %s" % (http_method, path)
+    return call
+
+
+class SidechainApiClient(object):
+
+    def __init__(self, service_url, timeout=HTTP_TIMEOUT, proxy=None, codec=DECIMAL_CODEC):
+        self.url = service_url
+        if proxy is None:
+            proxy = SidechainAuthServiceProxy(service_url, timeout=timeout, codec=codec)
+        self.__proxy = proxy
+        self._request = proxy._request
+        self._encode = codec.encode
+
+    def __getattr__(self, name):
+        if name.startswith('__') and name.endswith('__'):
+            # Python internal stuff
+            raise AttributeError
+        return getattr(self.__proxy, name)
+
+
+for _name, _http_method, _path in SIDECHAIN_API_ROUTES:
+    setattr(SidechainApiClient, _name, _route_method(_name, _http_method, _path))
@@ -3,25 +3,98 @@ try:
 except ImportError:
     import httplib
 import base64
-import decimal
-import json
+import io
 import logging
 import re
+import socket
+import time
 try:
     import urllib.parse as urlparse
 except ImportError:
     import urlparse
 
+from test_framework.callstats import CALL_STATS
+from test_framework.connectionpool import ConnectionPool, POOL_SIZE, is_connection_lost
+from test_framework.deadline import current_deadline, RequestTimeout
+from test_framework.httpcompression import ACCEPT_ENCODING, response_body
+from test_framework.jsoncodec import DECIMAL_CODEC
+from test_framework.jsonstream import iter_json_array, JSONStreamError
+from test_framework.responsecache import SC_CACHEABLE_ROUTES
+from test_framework.singleflight import SingleFlight, SC_IDEMPOTENT_ROUTES
+
 USER_AGENT = "SidechainAuthServiceProxy/0.1"
 
 HTTP_TIMEOUT = 6000000
 
+# Timeout in seconds of the requests to each route, capped by the proxy timeout and by the active deadline (see
+# test_framework/deadline.py). Routes not listed here get DEFAULT_ROUTE_TIMEOUT.
+DEFAULT_ROUTE_TIMEOUT = 120
+ROUTE_TIMEOUTS = {
+    "/block/best": 10,
+    "/block/findById": 30,
+    "/block/findLastIds": 10,
+    "/block/findIdByHeight": 10,
+    "/block/forgingInfo": 10,
+    "/block/startForging": 10,
+    "/block/stopForging": 10,
+    "/block/generate": 600,
+    "/wallet/allBoxes": 300,
+    "/wallet/balance": 30,
+    "/transaction/allTransactions": 60,
+    "/node/allPeers": 10,
+    "/node/connectedPeers": 10,
+    "/node/connect": 10,
+}
+
 
 class SCAPIException(Exception):
     def __init__(self, sc_api_error):
         Exception.__init__(self)
         self.error = sc_api_error
-        
+
+
+class SCAPITimeoutException(SCAPIException, RequestTimeout):
+    def __init__(self, method, path, timeout, deadline=None):
+        if timeout > 0:
+            message = "%s %s stalled: no response within %.3fs" % (method, path, timeout)
+        else:
+            message = "%s %s not sent: deadline expired" % (method, path)
+        SCAPIException.__init__(self, message + (" (%s)" % deadline if deadline is not None else ""))
+        self.route = path
+        self.timeout = timeout
+        self.deadline = deadline
+
+
+class _SharedFile(object):
+    """
+    Buffered reader of a pipelined connection, handed to each HTTPResponse in turn: closing a response must not
+    close it, nor lose the bytes of the following responses read ahead in its buffer.
+    """
+
+    def __init__(self, fp):
+        self.__fp = fp
+
+    def makefile(self, *args, **kwargs):
+        return self
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self.__fp, name)
+
+
+def _route_of(service_name):
+    if re.match(r'^get', service_name):
+        method = 'GET'
+        path = re.split(r'get_', service_name, maxsplit=1)[1]
+    else:
+        method = 'POST'
+        path = service_name
+    path = "/" + path.replace("_","/") #Replacing underscores with slashes to correctly format the Rest API request
+    return method, path
+
+
 """
    Adaption of AuthServiceProxy class from BTF for Scorex REST API. Differences are very minimal:
    1) Method names follows a path-like style. Therefore method names are passed to __call__ method with underscores
@@ -29,14 +102,45 @@ class SCAPIException(Exception):
    2) Auth header must be a string that hashes to the field "api-key-hash" specified in each SC node conf file. If
       no string is specified or authentication is disabled by default, this field could be omitted;
    3) In case of errors, instead of JSONRPCException we use SCAPIException
+   4) Requests go through a per-node pool of keep-alive connections (see connectionpool.py) shared by all the
+      attribute-derived proxies, so the same node can be called from several threads concurrently. Idle
+      connections are revalidated before reuse and requests are retried on a lost connection
+   5) Requests and responses go through a pluggable JSON codec (see jsoncodec.py): Decimal-based by default,
+      INTEGER_CODEC/FAST_CODEC avoid Decimals for the integer-only SC payloads
+   6) Big array results can be streamed element by element instead of being decoded as a whole:
+      for box in sc_node.wallet_allBoxes._stream("result.boxes"): ...
+   7) Requests on content-addressed routes (block/findById, mainchain/blockReferenceByHash) can be served from a
+      ResponseCache (see responsecache.py), opt-in through the cache parameter
+   8) Identical read-only requests issued concurrently by several threads are coalesced into one (see
+      singleflight.py)
+   9) gzip/deflate compressed responses are accepted and decompressed on the fly (see httpcompression.py), unless
+      compression is disabled
+   10) Each route has its own timeout (ROUTE_TIMEOUTS, overridable with route_timeouts), further limited by the
+       deadline active in the calling thread. A stalled request is cancelled by closing its connection and
+       SCAPITimeoutException, naming the route, is raised
+   11) All the exchanges can be recorded to a traffic file or served from one (see traffic.py)
+   12) Latency and sizes of the requests are collected per route in CALL_STATS (see callstats.py)
+   13) Several requests can be pipelined on one connection, costing about one round trip:
+       best, balance = sc_node._multi_get(["block_best", "wallet_balance"])
 """
 
+
 class SidechainAuthServiceProxy(object):
-    __id_count = 0
 
-    def __init__(self, service_url, service_name=None, timeout=HTTP_TIMEOUT, connection=None):
+    def __init__(self, service_url, service_name=None, timeout=HTTP_TIMEOUT, pool=None, pool_size=POOL_SIZE,
+                 codec=DECIMAL_CODEC, cache=None, flights=None, compression=True, route_timeouts=None, traffic=None):
         self.__service_url = service_url
         self.__service_name = service_name
+        self.__timeout = timeout
+        if route_timeouts is None:
+            self.__route_timeouts = ROUTE_TIMEOUTS
+        else:
+            self.__route_timeouts = dict(ROUTE_TIMEOUTS)
+            self.__route_timeouts.update(route_timeouts)
+        self.__codec = codec
+        self.__cache = cache
+        self.__compression = compression
+        self.__traffic = traffic
         self.__url = urlparse.urlparse(service_url)
         if self.__url.port is None:
             port = 80
@@ -54,17 +158,15 @@ class SidechainAuthServiceProxy(object):
         #Still to identify which kind of authentication we will have
         authpair = user + b':' + passwd
         self.__auth_header = b'Basic ' + base64.b64encode(authpair)
+        if traffic is not None:
+            self.__node = traffic.node_label(self.__url.netloc)
 
-        if connection:
-            # Callables re-use the connection of the original proxy
-            self.__conn = connection
-        elif self.__url.scheme == 'https':
-            self.__conn = httplib.HTTPSConnection(self.__url.hostname, port,
-                                                  None, None, False,
-                                                  timeout)
+        if pool:
+            # Callables re-use the connection pool of the original proxy
+            self.__pool = pool
         else:
-            self.__conn = httplib.HTTPConnection(self.__url.hostname, port,
-                                                 False, timeout)
+            self.__pool = ConnectionPool(self.__url.scheme, self.__url.hostname, port, timeout, pool_size)
+        self.__flights = flights or SingleFlight()
 
     def __getattr__(self, name):
         if name.startswith('__') and name.endswith('__'):
@@ -72,60 +174,276 @@ class SidechainAuthServiceProxy(object):
             raise AttributeError
         if self.__service_name is not None:
             name = "%s.%s" % (self.__service_name, name)
-        return SidechainAuthServiceProxy(self.__service_url, name, connection=self.__conn)
+        return SidechainAuthServiceProxy(self.__service_url, name, timeout=self.__timeout, pool=self.__pool,
+                                         codec=self.__codec, cache=self.__cache, flights=self.__flights,
+                                         compression=self.__compression, route_timeouts=self.__route_timeouts,
+                                         traffic=self.__traffic)
 
-    def _request(self, method, path, postdata):
-        '''
-        Do a HTTP request, with retry if we get disconnected (e.g. due to a timeout).
-        This is a workaround for https://bugs.python.org/issue3566 which is fixed in Python 3.5.
-        '''
-        
+    def _headers(self):
         headers = {'Host': self.__url.hostname,
                    'User-Agent': USER_AGENT,
                    'Authorization': self.__auth_header,
                    'Content-type': 'application/json'}
+        if self.__compression:
+            headers['Accept-Encoding'] = ACCEPT_ENCODING
+        return headers
+
+    def _request(self, method, path, postdata):
+        # Keyed by node too: the cache is shared, and a node must never get the answer of another one
+        cache_key = (self.__url.netloc, path, postdata) \
+            if self.__cache is not None and path in SC_CACHEABLE_ROUTES else None
+        if cache_key is not None:
+            responsedata = self.__cache.get(cache_key)
+            if responsedata is not None:
+                return self.__codec.decode(responsedata)
+        if path in SC_IDEMPOTENT_ROUTES:
+            timeout, active = self._timeout(method, path)
+            responsedata = self.__flights.do((method, path, postdata),
+                                             lambda: self._request_raw(method, path, postdata), timeout,
+                                             lambda: SCAPITimeoutException(method, path, timeout, active))
+        else:
+            responsedata = self._request_raw(method, path, postdata)
+        response = self.__codec.decode(responsedata)
+        if cache_key is not None and "result" in response:
+            # Errors (e.g. a block not known yet) are not cached
+            self.__cache.put(cache_key, responsedata)
+        return response
+
+    def _timeout(self, method, path):
+        '''
+        Return the timeout of a request to path and the active deadline, raise SCAPITimeoutException if expired.
+        '''
+        timeout = min(self.__timeout, self.__route_timeouts.get(path, DEFAULT_ROUTE_TIMEOUT))
+        active = current_deadline()
+        if active is not None:
+            if active.expired():
+                raise SCAPITimeoutException(method, path, 0, active)
+            timeout = min(timeout, active.remaining())
+        return timeout, active
+
+    @staticmethod
+    def _set_timeout(conn, timeout):
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+
+    def _request_raw(self, method, path, postdata):
+        '''
+        Do a HTTP request and return the response body, raise SCAPIException if it is not successful.
+        '''
+        start = time.time()
         try:
-            self.__conn.request(method, path, postdata, headers)
-            return self._get_response()
-        except Exception as e:
-            # If connection was closed, try again.
-            # Python 3.5+ raises BrokenPipeError instead of BadStatusLine when the connection was reset.
-            # ConnectionResetError happens on FreeBSD with Python 3.4.
-            # These classes don't exist in Python 2.x, so we can't refer to them directly.
-            if ((isinstance(e, httplib.BadStatusLine) and e.line == "''")
-                or e.__class__.__name__ in ('BrokenPipeError', 'ConnectionResetError')
-                or (e.__class__.__name__ == "error" and (e.errno == 10053 or e.errno == 10054))):
-                self.__conn.close()
-                self.__conn.request(method, path, postdata, headers)
-                return self._get_response()
+            if self.__traffic is not None:
+                status, responsedata = self.__traffic.exchange(self.__node, method, path, postdata,
+                                                               path in SC_IDEMPOTENT_ROUTES,
+                                                               lambda: self._exchange(method, path, postdata))
             else:
-                raise
+                status, responsedata = self._exchange(method, path, postdata)
+        except:
+            CALL_STATS.record("SC " + path, time.time() - start, len(postdata or ""), 0, error=True)
+            raise
+        finally:
+            if path not in SC_IDEMPOTENT_ROUTES:
+                # Even failed, it may have changed the node state: don't follow reads started before it
+                self.__flights.wrote()
+        CALL_STATS.record("SC " + path, time.time() - start, len(postdata or ""), len(responsedata),
+                          error=status != 200)
+        if status != 200: #For the moment we check for errors in this way
+            raise SCAPIException(responsedata.decode('utf8'))
+        return responsedata
 
-    #For backward compatibility with pre-exisistent Hybrid App APIs, the method accept *args too. 
-    #In the new SC APIs there will be only **kwargs.
-    def __call__(self, *args, **kwargs):
-        SidechainAuthServiceProxy.__id_count += 1
-        if re.match(r'^get', self.__service_name):
-            method = 'GET'
-            path = re.split(r'get_', self.__service_name, maxsplit=1)[1]
-        else:
-            method = 'POST'
-            path = self.__service_name
-        path = "/" + path.replace("_","/") #Replacing underscores with slashes to correctly format the Rest API request
+    def _exchange(self, method, path, postdata):
+        '''
+        Do a HTTP request, with retry if we get disconnected (see ConnectionPool.exchange), and return the
+        response status and body.
+        '''
+        timeout, active = self._timeout(method, path)
+        conn = self.__pool.acquire()
+        try:
+            self._set_timeout(conn, timeout)
+            http_response = self._send(conn, method, path, postdata, self._headers())
+            responsedata = self._read_response(http_response)
+        except socket.timeout:
+            # The late response would be read by the next request: drop the connection
+            self.__pool.discard(conn)
+            raise SCAPITimeoutException(method, path, timeout, active)
+        except:
+            self.__pool.discard(conn)
+            raise
+        self.__pool.release(conn)
+        return http_response.status, responsedata
+
+    def _send(self, conn, method, path, postdata, headers):
+        # Read-only routes can be safely sent again if the connection is lost after sending them
+        return self.__pool.exchange(conn, method, path, postdata, headers, path in SC_IDEMPOTENT_ROUTES)
+
+    def _route(self, args, kwargs):
+        method, path = _route_of(self.__service_name)
         postdata = None
         if len(args) > 0:
             postdata = args[0]
         if len(kwargs) > 0:
-            postdata = json.dumps(kwargs)
+            postdata = self.__codec.encode(kwargs)
+        return method, path, postdata
+
+    #For backward compatibility with pre-exisistent Hybrid App APIs, the method accept *args too. 
+    #In the new SC APIs there will be only **kwargs.
+    def __call__(self, *args, **kwargs):
+        method, path, postdata = self._route(args, kwargs)
         response = self._request(method, path, postdata)
         return response
 
-    def _get_response(self):
-        http_response = self.__conn.getresponse()
+    def _stream(self, selector, *args, **kwargs):
+        '''
+        Same request as __call__, but parse the response incrementally while reading it from the socket and yield
+        one by one the elements of the array at selector (e.g. "result.boxes"), see jsonstream.py.
+        The connection is held until the generator is exhausted or closed.
+        '''
+        method, path, postdata = self._route(args, kwargs)
+        if self.__traffic is not None:
+            # Recorded and replayed responses are whole
+            try:
+                for element in iter_json_array(io.BytesIO(self._request_raw(method, path, postdata)), selector,
+                                               self.__codec.decode):
+                    yield element
+            except JSONStreamError as e:
+                if e.error is not None:
+                    raise SCAPIException(e.error)
+                raise
+            return
+        timeout, active = self._timeout(method, path)
+        start = time.time()
+        conn = self.__pool.acquire()
+        reusable = False
+        failed = True
+        http_response = None
+        try:
+            self._set_timeout(conn, timeout)
+            http_response = self._send(conn, method, path, postdata, self._headers())
+            if http_response.status != 200:
+                self._get_response(http_response)
+            try:
+                for element in iter_json_array(response_body(http_response), selector, self.__codec.decode):
+                    yield element
+            except JSONStreamError as e:
+                if e.error is not None:
+                    raise SCAPIException(e.error)
+                raise
+            # Drain what follows the array to leave the connection ready for the next request
+            http_response.read()
+            reusable = True
+            failed = False
+        except GeneratorExit:
+            # Closed by the consumer before the end
+            failed = False
+            raise
+        except SCAPIException:
+            reusable = http_response is not None and http_response.isclosed()
+            raise
+        except socket.timeout:
+            raise SCAPITimeoutException(method, path, timeout, active)
+        finally:
+            if reusable:
+                self.__pool.release(conn)
+            else:
+                self.__pool.discard(conn)
+            # The whole stream, from the request to the last element consumed. Only the size on the wire is known.
+            response_length = http_response.getheader("Content-Length") if http_response is not None else None
+            CALL_STATS.record("SC " + path, time.time() - start, len(postdata or ""), int(response_length or 0),
+                              error=failed)
+
+    def _multi_get(self, requests):
+        '''
+        Send requests back-to-back on one keep-alive connection (HTTP/1.1 pipelining) and return their decoded
+        responses, in order. Each request is a method name (e.g. "block_best") or a (method name, body) pair, the
+        body being a string or a dict to serialize. If some responses are errors, SCAPIException is raised for the
+        first one once all the responses are read. Responses are never cached nor coalesced.
+        '''
+        routed = []
+        for request in requests:
+            name, body = (request, None) if isinstance(request, str) else request
+            routed.append(_route_of(name) + (self.__codec.encode(body) if isinstance(body, dict) else body,))
+        if self.__traffic is not None:
+            # Recorded and replayed one by one
+            return [self.__codec.decode(self._request_raw(*request)) for request in routed]
+
+        timeouts = [self._timeout(method, path) for (method, path, postdata) in routed]
+        timeout = max(route_timeout for (route_timeout, active) in timeouts)
+        active = timeouts[0][1]
+        idempotent = all(path in SC_IDEMPOTENT_ROUTES for (method, path, postdata) in routed)
+        routes = ", ".join(path for (method, path, postdata) in routed)
+        conn = self.__pool.acquire()
+        try:
+            self._set_timeout(conn, timeout)
+            try:
+                results, reusable = self._pipeline(conn, routed)
+            except Exception as e:
+                # A connection lost before any response can be retried on a new one
+                if not (idempotent and is_connection_lost(e)):
+                    raise
+                conn.close()
+                results, reusable = self._pipeline(conn, routed)
+        except socket.timeout:
+            self.__pool.discard(conn)
+            raise SCAPITimeoutException("PIPELINE", routes, timeout, active)
+        except:
+            self.__pool.discard(conn)
+            raise
+        finally:
+            if not idempotent:
+                self.__flights.wrote()
+        if reusable:
+            self.__pool.release(conn)
+        else:
+            self.__pool.discard(conn)
+
+        responses = []
+        for (status, responsedata) in results:
+            if status != 200:
+                raise SCAPIException(responsedata.decode('utf8'))
+            responses.append(self.__codec.decode(responsedata))
+        return responses
+
+    def _pipeline(self, conn, routed):
+        '''
+        Write all the requests, then read all the responses. Return the (status, body) pairs and whether the
+        connection can be reused.
+        '''
+        if conn.sock is None:
+            conn.connect()
+        headers = self._headers()
+        data = []
+        for (method, path, postdata) in routed:
+            body = b"" if postdata is None else postdata.encode('utf8') if not isinstance(postdata, bytes) else postdata
+            head = "%s %s HTTP/1.1\r\n" % (method, path)
+            head += "".join("%s: %s\r\n" % (key, value.decode('ascii') if isinstance(value, bytes) else value)
+                            for (key, value) in headers.items())
+            head += "Content-Length: %d\r\n\r\n" % len(body)
+            data.append(head.encode('latin-1') + body)
+        start = time.time()
+        conn.sock.sendall(b"".join(data))
+
+        shared = _SharedFile(conn.sock.makefile('rb'))
+        results = []
+        reusable = True
+        for (method, path, postdata) in routed:
+            http_response = httplib.HTTPResponse(shared, method=method)
+            http_response.begin()
+            responsedata = self._read_response(http_response)
+            CALL_STATS.record("SC " + path, time.time() - start, len(postdata or ""), len(responsedata),
+                              error=http_response.status != 200)
+            results.append((http_response.status, responsedata))
+            reusable = reusable and not http_response.will_close
+        return results, reusable
+
+    def _read_response(self, http_response):
         if http_response is None:
             raise SCAPIException("missing HTTP response from server")
-        responsedata = http_response.read().decode('utf8')
-        if http_response.status is not 200: #For the moment we check for errors in this way
-            raise SCAPIException(responsedata)
-        response = json.loads(responsedata, parse_float=decimal.Decimal)
+        return response_body(http_response).read()
+
+    def _get_response(self, http_response):
+        responsedata = self._read_response(http_response)
+        if http_response.status != 200: #For the moment we check for errors in this way
+            raise SCAPIException(responsedata.decode('utf8'))
+        response = self.__codec.decode(responsedata)
         return response
\ No newline at end of file
@@ -0,0 +1,71 @@
+import threading
+from multiprocessing.pool import ThreadPool
+
+from test_framework.deadline import current_deadline, using
+
+CONCURRENT_REQUESTS = 64
+
+"""
+   Concurrent counterpart of SidechainAuthServiceProxy, to keep many requests in flight across all the SC nodes
+   from a single test process. It wraps a SidechainAuthServiceProxy and follows the same conventions (block_best ->
+   /block/best, "get_" prefix -> GET, SCAPIException on errors), but a call returns at once a pending result
+   (multiprocessing.pool.AsyncResult) whose get() returns the response or raises the error of the request.
+   Requests run on a thread pool of CONCURRENT_REQUESTS threads shared by all the proxies, under the deadline active
+   in the calling thread (see test_framework/deadline.py). Each one borrows a keep-alive connection from the pool of
+   the wrapped proxy, so at most pool_size requests per node are on the wire at once: create the wrapped proxy with a
+   bigger pool_size to load a node harder.
+
+   Example:
+       proxies = [SidechainConcurrentServiceProxy(SidechainAuthServiceProxy(sc_node.url, pool_size=16))
+                  for sc_node in self.sc_nodes]
+       pending = [proxy.block_best() for proxy in proxies for i in range(100)]
+       heights = [best["result"]["height"] for best in gather(pending)]
+"""
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _thread_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(CONCURRENT_REQUESTS)
+        return _pool
+
+
+def _submit(function, *args):
+    deadline = current_deadline()
+
+    def call():
+        with using(deadline):
+            return function(*args)
+    return _thread_pool().apply_async(call)
+
+
+def gather(pending, timeout=None):
+    """
+    Wait for the pending results and return their values, in order. The first error is raised.
+    """
+    return [result.get(timeout) for result in pending]
+
+
+class SidechainConcurrentServiceProxy(object):
+
+    def __init__(self, proxy):
+        self.__proxy = proxy
+
+    def __getattr__(self, name):
+        if name.startswith('__') and name.endswith('__'):
+            # Python internal stuff
+            raise AttributeError
+        return SidechainConcurrentServiceProxy(getattr(self.__proxy, name))
+
+    def __call__(self, *args, **kwargs):
+        return _submit(lambda: self.__proxy(*args, **kwargs))
+
+    def _multi_get(self, requests):
+        '''
+        Pending result of SidechainAuthServiceProxy._multi_get: the requests are pipelined on one connection.
+        '''
+        return _submit(self.__proxy._multi_get, requests)
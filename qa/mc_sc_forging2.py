@@ -142,7 +142,7 @@ class MCSCForging2(SidechainTestFramework):
 
         assert_equal(genesis_sc_block_id, sc_node2.block_best()["result"])
         connect_sc_nodes(self.sc_nodes[0], 1)
-        self.sc_sync_all()
+        self.sc_sync_all(tips=True)
 
         assert_equal(sc_node1.block_best()["result"], sc_node2.block_best()["result"])
 
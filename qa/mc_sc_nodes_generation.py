@@ -1,7 +1,7 @@
 #!/usr/bin/env python2
 from SidechainTestFramework.sc_test_framework import SidechainTestFramework
-from test_framework.util import assert_equal, assert_true, initialize_chain_clean, start_nodes, connect_nodes_bi, sync_mempools, sync_blocks
-from SidechainTestFramework.scutil import initialize_default_sc_chain_clean, start_sc_nodes, connect_sc_nodes, sync_sc_mempools, sync_sc_blocks, \
+from test_framework.util import assert_equal, assert_true, initialize_chain_clean, start_nodes, connect_topology, sync_mempools, sync_blocks
+from SidechainTestFramework.scutil import initialize_default_sc_chain_clean, start_sc_nodes, connect_sc_topology, sync_sc_mempools, sync_sc_blocks, \
                                           wait_for_next_sc_blocks
 import json
 import random
@@ -27,9 +27,7 @@ class MainchainSidechainNodeBlockGenerationTest(SidechainTestFramework):
         self.nodes = self.setup_nodes()
         print("OK\n")
         print("Connecting mainchain nodes node0, node1 and node2...")
-        connect_nodes_bi(self.nodes, 0, 1)
-        connect_nodes_bi(self.nodes, 0, 2)
-        connect_nodes_bi(self.nodes, 1, 2)
+        connect_topology(self.nodes, [(0, 1), (0, 2), (1, 2)])
         print("OK\n")
         
     def setup_nodes(self):
@@ -43,9 +41,7 @@ class MainchainSidechainNodeBlockGenerationTest(SidechainTestFramework):
         self.sc_nodes = self.sc_setup_nodes()
         print("OK\n")
         print("Connecting sidechain nodes node0, node1 and node2...")
-        connect_sc_nodes(self.sc_nodes[0], 1)
-        connect_sc_nodes(self.sc_nodes[0], 2)
-        connect_sc_nodes(self.sc_nodes[1], 2)
+        connect_sc_topology(self.sc_nodes, [(0, 1), (0, 2), (1, 2)])
         self.sc_sync_all()
         print("OK\n")
     
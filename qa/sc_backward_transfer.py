@@ -8,6 +8,7 @@ from SidechainTestFramework.sc_boostrap_info import SCNodeConfiguration, SCCreat
 from SidechainTestFramework.sc_test_framework import SidechainTestFramework
 from test_framework.util import fail, assert_equal, assert_true, start_nodes, \
     websocket_port_by_mc_node_index
+from test_framework.mcmempool import wait_for_certificate
 from SidechainTestFramework.scutil import bootstrap_sidechain_nodes, \
     start_sc_nodes, check_box_balance, check_wallet_balance, generate_next_blocks
 from SidechainTestFramework.sc_forging_util import *
@@ -101,22 +102,20 @@ class SCBackwardTransfer(SidechainTestFramework):
 
         # Generate first mc block of the next epoch
         we1_1_mcblock_hash = mc_node.generate(1)[0]
+        we0_end_time = time.time()
         print("End mc block hash in withdrawal epoch 0 = " + we0_end_mcblock_hash)
         scblock_id3 = generate_next_blocks(sc_node, "first node", 1)[0]
         check_mcreference_presence(we1_1_mcblock_hash, scblock_id3, sc_node)
 
         # Wait until Certificate will appear in MC node mempool
-        attempts = 20
-        while mc_node.getmempoolinfo()["size"] == 0 and attempts > 0:
-            print("Wait for certificate in mc mempool...")
-            time.sleep(10)
-            attempts -= 1
-            sc_node.block_best() # just a ping to SC node. For some reason, STF can't request SC node API after a while idle.
+        we0_watched_cert_hash = wait_for_certificate(mc_node, self.sc_nodes_bootstrap_info.sidechain_id, 0,
+                                                     epoch_end_time=we0_end_time)[0]
         assert_equal(1, mc_node.getmempoolinfo()["size"], "Certificate was not added to Mc node mmepool.")
 
         # Get Certificate for Withdrawal epoch 0 and verify it
         we0_certHash = mc_node.getrawmempool()[0]
         print("Withdrawal epoch 0 certificate hash = " + we0_certHash)
+        assert_equal(we0_watched_cert_hash, we0_certHash, "Certificate in MC mempool is not the one expected.")
         we0_cert = mc_node.getrawcertificate(we0_certHash, 1)
         assert_equal(self.sc_nodes_bootstrap_info.sidechain_id, we0_cert["cert"]["scid"], "Sidechain Id in certificate is wrong.")
         assert_equal(0, we0_cert["cert"]["epochNumber"], "Sidechain epoch number in certificate is wrong.")
@@ -200,22 +199,20 @@ class SCBackwardTransfer(SidechainTestFramework):
 
         # Generate first mc block of the next epoch
         we2_1_mcblock_hash = mc_node.generate(1)[0]
+        we1_end_time = time.time()
         print("End mc block hash in withdrawal epoch 1 = " + we2_1_mcblock_hash)
         we2_1_scblock_id = generate_next_blocks(sc_node, "first node", 1)[0]
         check_mcreference_presence(we2_1_mcblock_hash, we2_1_scblock_id, sc_node)
 
         # Wait until Certificate will appear in MC node mempool
-        attempts = 20
-        while mc_node.getmempoolinfo()["size"] == 0 and attempts > 0:
-            print("Wait for certificate in mc mempool...")
-            time.sleep(10)
-            attempts -= 1
-            sc_node.block_best()  # just a ping to SC node. For some reason, STF can't request SC node API after a while idle.
+        we1_watched_cert_hash = wait_for_certificate(mc_node, self.sc_nodes_bootstrap_info.sidechain_id, 1,
+                                                     epoch_end_time=we1_end_time)[0]
         assert_equal(1, mc_node.getmempoolinfo()["size"], "Certificate was not added to Mc node mmepool.")
 
         # Get Certificate for Withdrawal epoch 1 and verify it
         we1_certHash = mc_node.getrawmempool()[0]
         print("Withdrawal epoch 1 certificate hash = " + we1_certHash)
+        assert_equal(we1_watched_cert_hash, we1_certHash, "Certificate in MC mempool is not the one expected.")
         we1_cert = mc_node.getrawcertificate(we1_certHash, 1)
         assert_equal(self.sc_nodes_bootstrap_info.sidechain_id, we1_cert["cert"]["scid"],
                      "Sidechain Id in certificate is wrong.")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python2
+import time
+
+from SidechainTestFramework.sc_test_framework import SidechainTestFramework
+from SidechainTestFramework.sidechainauthproxy import SidechainAuthServiceProxy
+from SidechainTestFramework.sidechainconcurrentproxy import SidechainConcurrentServiceProxy, gather
+from test_framework.util import assert_equal
+from SidechainTestFramework.scutil import connect_sc_topology, initialize_default_sc_chain_clean, start_sc_nodes, \
+    generate_next_blocks, sync_sc_blocks
+
+"""
+Drive concurrent API load on the SC nodes with SidechainConcurrentServiceProxy.
+
+Configuration: 3 SC nodes connected together.
+
+Load:
+    - forge a few blocks on node0 and sync the nodes
+    - send the same requests (block/best, block/findById of the tip, wallet/balance) to all the nodes, first one
+      at a time with the blocking proxies, then all in flight at once with the concurrent proxies
+    - check that both runs return the same results and print the requests per second of each
+"""
+
+
+class SCConcurrentAPILoad(SidechainTestFramework):
+
+    number_of_nodes = 3
+    requests_per_node = 200
+    pool_size = 16
+
+    def add_options(self, parser):
+        #empty implementation
+        pass
+
+    def setup_chain(self):
+        #empty implementation
+        pass
+
+    def setup_network(self, split = False):
+        #empty implementation
+        pass
+
+    def sc_setup_chain(self):
+        initialize_default_sc_chain_clean(self.options.tmpdir, self.number_of_nodes)
+
+    def sc_setup_network(self, split = False):
+        self.sc_nodes = self.sc_setup_nodes()
+        connect_sc_topology(self.sc_nodes, [(0, 1), (1, 2)])
+        self.sc_sync_all()
+
+    def sc_setup_nodes(self):
+        return start_sc_nodes(self.number_of_nodes, self.options.tmpdir)
+
+    def run_test(self):
+        tip = generate_next_blocks(self.sc_nodes[0], "first node", 3)[-1]
+        sync_sc_blocks(self.sc_nodes)
+
+        blocking = [SidechainAuthServiceProxy(sc_node.url, pool_size=self.pool_size) for sc_node in self.sc_nodes]
+        concurrent = [SidechainConcurrentServiceProxy(proxy) for proxy in blocking]
+        calls = [
+            lambda proxy: proxy.block_best(),
+            lambda proxy: proxy.block_findById(blockId=tip),
+            lambda proxy: proxy.wallet_balance(),
+        ]
+        work = [(i, calls[n % len(calls)]) for i in range(self.number_of_nodes)
+                for n in range(self.requests_per_node)]
+
+        start = time.time()
+        expected = [call(blocking[i]) for (i, call) in work]
+        sequential = time.time() - start
+
+        start = time.time()
+        results = gather([call(concurrent[i]) for (i, call) in work])
+        parallel = time.time() - start
+
+        assert_equal(expected, results, "Concurrent requests returned different results")
+        print("{0} requests to {1} nodes: {2:.1f} req/s one at a time, {3:.1f} req/s concurrently"
+              .format(len(work), self.number_of_nodes, len(work) / sequential, len(work) / parallel))
+
+
+if __name__ == "__main__":
+    SCConcurrentAPILoad().main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python2
+import time
+
+from SidechainTestFramework.sc_boostrap_info import SCNodeConfiguration, SCCreationInfo, MCConnectionInfo, \
+    SCNetworkConfiguration
+from SidechainTestFramework.sc_test_framework import SidechainTestFramework
+from SidechainTestFramework.sc_fast_start import enable_fast_start, disable_fast_start
+from test_framework.util import start_nodes, websocket_port_by_mc_node_index
+from SidechainTestFramework.scutil import bootstrap_sidechain_nodes, start_sc_node, stop_sc_nodes, \
+    wait_sidechainclients, wait_for_sc_node_initialization, build_sc_fast_start_archive, sc_node_classpath
+
+"""
+Benchmark the time to ready of the SC nodes with and without the fast start profile (see
+SidechainTestFramework/sc_fast_start.py).
+
+Configuration: 1 MC node and 2 SC nodes connected to it.
+
+Benchmark:
+    - restart the SC nodes a few times without the profile, measuring the time from their launch to the first
+      answer of their API
+    - build the class data sharing archive of the profile if it is missing or outdated, print the build time
+    - restart the SC nodes as many times with the profile (JVM flags of --scjvmflags)
+    - print the best and average time to ready of both modes
+    Without a JVM supporting AppCDS (Java 10+) the profile only applies the JVM flags.
+"""
+
+
+class SCFastStartBenchmark(SidechainTestFramework):
+
+    number_of_sc_nodes = 2
+    rounds = 3
+
+    def setup_nodes(self):
+        return start_nodes(1, self.options.tmpdir)
+
+    def sc_setup_chain(self):
+        mc_node = self.nodes[0]
+        sc_node_configuration = SCNodeConfiguration(
+            MCConnectionInfo(address="ws://{0}:{1}".format(mc_node.hostname, websocket_port_by_mc_node_index(0)))
+        )
+        network = SCNetworkConfiguration(SCCreationInfo(mc_node, 600, 1000),
+                                         *[sc_node_configuration for i in range(self.number_of_sc_nodes)])
+        self.sc_nodes_bootstrap_info = bootstrap_sidechain_nodes(self.options.tmpdir, network)
+
+    def sc_setup_network(self, split=False):
+        # Started by run_test, in both modes
+        self.sc_nodes = []
+
+    def time_to_ready(self, last):
+        """
+        Start the SC nodes and return their time to ready, stopping them unless this is the last round.
+        """
+        start = time.time()
+        nodes = [start_sc_node(i, self.options.tmpdir) for i in range(self.number_of_sc_nodes)]
+        ready = wait_for_sc_node_initialization(nodes, since=start)
+        if last:
+            self.sc_nodes = nodes
+        else:
+            stop_sc_nodes(nodes)
+            wait_sidechainclients()
+        return max(ready)
+
+    def run_test(self):
+        results = {}
+
+        disable_fast_start()
+        results["off"] = [self.time_to_ready(False) for i in range(self.rounds)]
+
+        profile = enable_fast_start(self.options.sc_jvm_flags)
+        classpath = sc_node_classpath()[0]
+        if profile.needs_archive(classpath):
+            build_sc_fast_start_archive(0, self.options.tmpdir)
+        archive = profile.archive(classpath)
+        results["on"] = [self.time_to_ready(i == self.rounds - 1) for i in range(self.rounds)]
+
+        print("JVM flags: {0}".format(" ".join(profile.jvm_flags)))
+        print("CDS archive: {0}".format(archive or "none, the JVM doesn't support AppCDS"))
+        print("{0:<11} {1:>7} {2:>9} {3:>9}".format("fast start", "rounds", "best s", "average s"))
+        for mode in ("off", "on"):
+            times = results[mode]
+            print("{0:<11} {1:>7} {2:>9.3f} {3:>9.3f}".format(mode, len(times), min(times), sum(times) / len(times)))
+
+
+if __name__ == "__main__":
+    SCFastStartBenchmark().main()
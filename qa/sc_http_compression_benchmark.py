@@ -0,0 +1,111 @@
+#!/usr/bin/env python2
+import base64
+import json
+import time
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+try:
+    import urllib.parse as urlparse
+except ImportError:
+    import urlparse
+
+from SidechainTestFramework.sc_boostrap_info import SCNodeConfiguration, SCCreationInfo, MCConnectionInfo, \
+    SCNetworkConfiguration
+from SidechainTestFramework.sc_test_framework import SidechainTestFramework
+from SidechainTestFramework.sidechainauthproxy import SidechainAuthServiceProxy
+from test_framework.util import assert_equal, start_nodes, websocket_port_by_mc_node_index
+from test_framework.httpcompression import ACCEPT_ENCODING
+from SidechainTestFramework.scutil import bootstrap_sidechain_nodes, start_sc_nodes, generate_next_blocks
+
+"""
+Benchmark HTTP response compression (see test_framework/httpcompression.py) on real SC node payloads.
+
+Configuration: 1 MC node and 1 SC node connected to it.
+
+Benchmark:
+    - send many forward transfers to the SC in one MC block, so the SC block that references it and the SC wallet
+      are big
+    - for block/findById and wallet/allBoxes, print the response size on the wire and its encoding with and
+      without Accept-Encoding, and the average end-to-end call time of a proxy with and without compression
+    - check that both proxies return the same results
+    Nodes that don't compress their responses report the same sizes and encoding "identity" in both modes.
+"""
+
+
+def wire_size(url, path, postdata, accept_encoding):
+    parsed = urlparse.urlparse(url)
+    authpair = ("%s:%s" % (parsed.username, parsed.password)).encode('utf8')
+    headers = {'Authorization': b'Basic ' + base64.b64encode(authpair), 'Content-type': 'application/json'}
+    if accept_encoding:
+        headers['Accept-Encoding'] = accept_encoding
+    conn = httplib.HTTPConnection(parsed.hostname, parsed.port)
+    conn.request('POST', path, postdata, headers)
+    http_response = conn.getresponse()
+    size = len(http_response.read())
+    encoding = http_response.getheader("Content-Encoding") or "identity"
+    conn.close()
+    return size, encoding
+
+
+def average_call_time(call, iterations):
+    start = time.time()
+    for i in range(iterations):
+        call()
+    return (time.time() - start) / iterations
+
+
+class SCHttpCompressionBenchmark(SidechainTestFramework):
+
+    number_of_forward_transfers = 500
+    iterations = 20
+
+    def setup_nodes(self):
+        return start_nodes(1, self.options.tmpdir)
+
+    def sc_setup_chain(self):
+        mc_node = self.nodes[0]
+        sc_node_configuration = SCNodeConfiguration(
+            MCConnectionInfo(address="ws://{0}:{1}".format(mc_node.hostname, websocket_port_by_mc_node_index(0)))
+        )
+        network = SCNetworkConfiguration(SCCreationInfo(mc_node, 600, 1000), sc_node_configuration)
+        self.sc_nodes_bootstrap_info = bootstrap_sidechain_nodes(self.options.tmpdir, network)
+
+    def sc_setup_nodes(self):
+        return start_sc_nodes(1, self.options.tmpdir)
+
+    def run_test(self):
+        mc_node = self.nodes[0]
+        sc_node = self.sc_nodes[0]
+
+        public_key = self.sc_nodes_bootstrap_info.genesis_account.publicKey
+        send_many_params = [{"scid": self.sc_nodes_bootstrap_info.sidechain_id, "amount": 0.01, "address": public_key}
+                            for i in range(self.number_of_forward_transfers)]
+        mc_node.sc_sendmany(send_many_params)
+        mc_node.generate(1)
+        scblock_id = generate_next_blocks(sc_node, "first node", 1)[0]
+
+        proxies = {True: SidechainAuthServiceProxy(sc_node.url, compression=True),
+                   False: SidechainAuthServiceProxy(sc_node.url, compression=False)}
+        find_by_id_body = json.dumps({"blockId": scblock_id})
+        routes = [
+            ("block/findById", "/block/findById", find_by_id_body,
+             lambda proxy: proxy.block_findById(find_by_id_body)),
+            ("wallet/allBoxes", "/wallet/allBoxes", None,
+             lambda proxy: proxy.wallet_allBoxes()),
+        ]
+
+        print("{0:<16} {1:<12} {2:>10} {3:<9} {4:>8}".format("route", "compression", "wire bytes", "encoding",
+                                                            "ms/call"))
+        for (name, path, postdata, call) in routes:
+            assert_equal(call(proxies[False]), call(proxies[True]), "Compressed {0} response differs".format(name))
+            for compression in (False, True):
+                size, encoding = wire_size(sc_node.url, path, postdata, ACCEPT_ENCODING if compression else None)
+                elapsed = average_call_time(lambda: call(proxies[compression]), self.iterations)
+                print("{0:<16} {1:<12} {2:>10} {3:<9} {4:>8.3f}".format(name, "on" if compression else "off", size,
+                                                                       encoding, elapsed * 1000))
+
+
+if __name__ == "__main__":
+    SCHttpCompressionBenchmark().main()
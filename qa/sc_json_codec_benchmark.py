@@ -0,0 +1,107 @@
+#!/usr/bin/env python2
+import base64
+import json
+import time
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+try:
+    import urllib.parse as urlparse
+except ImportError:
+    import urlparse
+
+from SidechainTestFramework.sc_boostrap_info import SCNodeConfiguration, SCCreationInfo, MCConnectionInfo, \
+    SCNetworkConfiguration
+from SidechainTestFramework.sc_test_framework import SidechainTestFramework
+from test_framework.util import assert_equal, start_nodes, websocket_port_by_mc_node_index
+from test_framework.jsoncodec import DECIMAL_CODEC, INTEGER_CODEC, FAST_CODEC
+from SidechainTestFramework.scutil import bootstrap_sidechain_nodes, start_sc_nodes, generate_next_blocks
+
+"""
+Benchmark the JSON codecs of the proxies (see test_framework/jsoncodec.py) on real node payloads.
+
+Configuration: 1 MC node and 1 SC node connected to it.
+
+Benchmark:
+    - send many forward transfers to the SC in one MC block, so the SC block that references it and the SC wallet
+      are big
+    - fetch raw SC block/findById and wallet/allBoxes responses and the raw MC getblock response
+    - check that all the codecs decode the SC payloads to the same objects
+    - decode every payload with every applicable codec and print the average decode time
+      (the "fast" codec is lossy for non-integer numbers, so it is not applied to MC payloads)
+"""
+
+
+def fetch_raw(url, path, postdata):
+    parsed = urlparse.urlparse(url)
+    authpair = ("%s:%s" % (parsed.username, parsed.password)).encode('utf8')
+    conn = httplib.HTTPConnection(parsed.hostname, parsed.port)
+    conn.request('POST', path, postdata, {'Authorization': b'Basic ' + base64.b64encode(authpair),
+                                          'Content-type': 'application/json'})
+    responsedata = conn.getresponse().read()
+    conn.close()
+    return responsedata
+
+
+def average_decode_time(codec, payload, iterations):
+    start = time.time()
+    for i in range(iterations):
+        codec.decode(payload)
+    return (time.time() - start) / iterations
+
+
+class SCJsonCodecBenchmark(SidechainTestFramework):
+
+    number_of_forward_transfers = 500
+    iterations = 20
+
+    def setup_nodes(self):
+        return start_nodes(1, self.options.tmpdir)
+
+    def sc_setup_chain(self):
+        mc_node = self.nodes[0]
+        sc_node_configuration = SCNodeConfiguration(
+            MCConnectionInfo(address="ws://{0}:{1}".format(mc_node.hostname, websocket_port_by_mc_node_index(0)))
+        )
+        network = SCNetworkConfiguration(SCCreationInfo(mc_node, 600, 1000), sc_node_configuration)
+        self.sc_nodes_bootstrap_info = bootstrap_sidechain_nodes(self.options.tmpdir, network)
+
+    def sc_setup_nodes(self):
+        return start_sc_nodes(1, self.options.tmpdir)
+
+    def run_test(self):
+        mc_node = self.nodes[0]
+        sc_node = self.sc_nodes[0]
+
+        public_key = self.sc_nodes_bootstrap_info.genesis_account.publicKey
+        send_many_params = [{"scid": self.sc_nodes_bootstrap_info.sidechain_id, "amount": 0.01, "address": public_key}
+                            for i in range(self.number_of_forward_transfers)]
+        mc_node.sc_sendmany(send_many_params)
+        mcblock_hash = mc_node.generate(1)[0]
+        scblock_id = generate_next_blocks(sc_node, "first node", 1)[0]
+
+        payloads = [
+            ("SC block/findById", True, fetch_raw(sc_node.url, "/block/findById", json.dumps({"blockId": scblock_id}))),
+            ("SC wallet/allBoxes", True, fetch_raw(sc_node.url, "/wallet/allBoxes", None)),
+            ("MC getblock", False, fetch_raw(mc_node.url, "/", json.dumps({"version": "1.1", "method": "getblock",
+                                                                             "params": [mcblock_hash], "id": 1}))),
+        ]
+
+        print("{0:<20} {1:>10} {2:<8} {3:<11} {4:>10}".format("payload", "bytes", "codec", "backend", "ms/decode"))
+        for (name, integer_only, payload) in payloads:
+            codecs = [DECIMAL_CODEC]
+            if integer_only:
+                codecs += [INTEGER_CODEC] + ([FAST_CODEC] if FAST_CODEC is not INTEGER_CODEC else [])
+                reference = DECIMAL_CODEC.decode(payload)
+                for codec in codecs:
+                    assert_equal(reference, codec.decode(payload), "Codec {0} decoded {1} differently"
+                                 .format(codec.name, name))
+            for codec in codecs:
+                elapsed = average_decode_time(codec, payload, self.iterations)
+                print("{0:<20} {1:>10} {2:<8} {3:<11} {4:>10.3f}".format(name, len(payload), codec.name,
+                                                                         codec.backend, elapsed * 1000))
+
+
+if __name__ == "__main__":
+    SCJsonCodecBenchmark().main()
@@ -1,7 +1,7 @@
 #!/usr/bin/env python2
 from SidechainTestFramework.sc_test_framework import SidechainTestFramework
 from test_framework.util import assert_equal, assert_true, initialize_chain_clean, start_nodes, connect_nodes_bi, sync_mempools, sync_blocks
-from SidechainTestFramework.scutil import initialize_default_sc_chain_clean, start_sc_nodes, connect_sc_nodes, connect_sc_nodes_bi, sync_sc_mempools, sync_sc_blocks, \
+from SidechainTestFramework.scutil import initialize_default_sc_chain_clean, start_sc_nodes, connect_sc_topology, connect_sc_nodes_bi, sync_sc_mempools, sync_sc_blocks, \
                                           wait_for_next_sc_blocks, generate_next_blocks
 import time
 import json
@@ -28,9 +28,7 @@ class SidechainNodeBlockGenerationTest(SidechainTestFramework):
     def sc_setup_network(self, split = False):
         self.sc_nodes = self.sc_setup_nodes()
         print("Connecting sidechain nodes node0, node1 and node2...")
-        connect_sc_nodes(self.sc_nodes[0], 1)
-        connect_sc_nodes(self.sc_nodes[0], 2)
-        connect_sc_nodes(self.sc_nodes[1], 2)
+        connect_sc_topology(self.sc_nodes, [(0, 1), (0, 2), (1, 2)])
         self.sc_sync_all()
     
     def sc_setup_nodes(self):
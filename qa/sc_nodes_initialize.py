@@ -1,7 +1,7 @@
 #!/usr/bin/env python2
 from SidechainTestFramework.sc_test_framework import SidechainTestFramework
 from test_framework.util import assert_true, assert_equal
-from SidechainTestFramework.scutil import connect_sc_nodes, sc_p2p_port, initialize_default_sc_chain_clean, start_sc_nodes, wait_for_next_sc_blocks
+from SidechainTestFramework.scutil import connect_sc_topology, sc_p2p_port, initialize_default_sc_chain_clean, start_sc_nodes, wait_for_next_sc_blocks
 import time
 import json
 
@@ -30,9 +30,7 @@ class SidechainNodesInitializationTest(SidechainTestFramework):
         self.sc_nodes = self.sc_setup_nodes()
         #Connect nodes toghether
         print("Connecting node0, node1 and node2...")
-        connect_sc_nodes(self.sc_nodes[0], 1) #In Scorex, it is just needed to call connect on one of the two
-        connect_sc_nodes(self.sc_nodes[1], 2)
-        connect_sc_nodes(self.sc_nodes[0], 2)
+        connect_sc_topology(self.sc_nodes, [(0, 1), (1, 2), (0, 2)]) #In Scorex, it is just needed to call connect on one of the two
         self.sc_sync_all()
     
     def sc_setup_nodes(self):
@@ -2,7 +2,7 @@
 import json
 
 from SidechainTestFramework.sc_test_framework import SidechainTestFramework
-from test_framework.util import assert_equal, assert_true, start_nodes, forward_transfer_to_sidechain
+from test_framework.util import assert_equal, assert_true, start_nodes, forward_transfer_to_sidechain, batch_call
 from SidechainTestFramework.scutil import create_sidechain, \
     check_mainchain_block_reference_info, check_wallet_balance, generate_next_blocks
 from SidechainTestFramework.sc_boostrap_info import SCCreationInfo, Account
@@ -38,8 +38,7 @@ class McTxsData(SidechainTestFramework):
 
         # Generate MC Block without sidechains.
         block_id = mc_node.generate(1)[0]
-        block_hex = mc_node.getblock(block_id, False)
-        block_json = mc_node.getblock(block_id)
+        block_hex, block_json = batch_call(mc_node, "getblock", [(block_id, False), (block_id,)])
 
         print("MC Block without SC data: \nHash = {0}\nHex = {1}\nJson = {2}\n"
               .format(str(block_id), str(block_hex), str(block_json)))
@@ -63,8 +62,7 @@ class McTxsData(SidechainTestFramework):
         mc_node.sc_send(sc_address, 3, sidechain_id_3) # 3 Zen
         # Generate block
         block_id = mc_node.generate(1)[0]
-        block_hex = mc_node.getblock(block_id, False)
-        block_json = mc_node.getblock(block_id)
+        block_hex, block_json = batch_call(mc_node, "getblock", [(block_id, False), (block_id,)])
         # Note: we sort only 2 last characters, so almost equal to the sort of the little-endian bytes
         sidechain_ids = [sidechain_id_1, sidechain_id_2, sidechain_id_3]
         sorted_sidechain_ids = sorted(sidechain_ids, key = lambda x: x[-2:])
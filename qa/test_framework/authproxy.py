@@ -6,12 +6,24 @@
   ServiceProxy class:
 
   - HTTP connections persist for the life of the AuthServiceProxy object
-    (if server supports HTTP/1.1)
+    (if server supports HTTP/1.1) and are pooled, so one proxy can be
+    used from several threads at once; idle connections are revalidated
+    before reuse and lost connections are retried (see connectionpool.py)
   - sends protocol 'version', per JSON-RPC 1.1
   - sends proper, incrementing 'id'
   - sends Basic HTTP authentication headers
   - parses all JSON numbers that look like floats as Decimal
-  - uses standard Python json lib
+  - uses a pluggable JSON codec (see jsoncodec.py), standard Python json lib by default
+  - accepts gzip/deflate compressed responses, decompressed on the fly
+    (see httpcompression.py)
+  - can record all the exchanges to a traffic file or serve them from one
+    (see traffic.py)
+  - collects latency and sizes of the requests per method in CALL_STATS
+    (see callstats.py)
+  - can serve calls on content-addressed data from a ResponseCache
+    (see responsecache.py)
+  - coalesces identical read-only calls issued concurrently by several
+    threads into one request (see singleflight.py)
 
   Previous copyright, from python-jsonrpc/jsonrpc/proxy.py:
 
@@ -34,23 +46,31 @@
   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
 
-try:
-    import http.client as httplib
-except ImportError:
-    import httplib
 import base64
-import decimal
 import json
 import logging
+import socket
+import threading
+import time
 try:
     import urllib.parse as urlparse
 except ImportError:
     import urlparse
 
+from callstats import CALL_STATS
+from connectionpool import ConnectionPool, POOL_SIZE
+from deadline import current_deadline
+from httpcompression import ACCEPT_ENCODING, response_body
+from jsoncodec import EncodeDecimal, DECIMAL_CODEC
+from responsecache import MC_CACHEABLE_METHODS, MC_CHAIN_CHANGING_METHODS, is_hash
+from singleflight import SingleFlight, MC_IDEMPOTENT_METHODS
+
 USER_AGENT = "AuthServiceProxy/0.1"
 
 HTTP_TIMEOUT = 600
 
+MAX_BATCH_SIZE = 500
+
 log = logging.getLogger("BitcoinRPC")
 
 class JSONRPCException(Exception):
@@ -59,18 +79,19 @@ class JSONRPCException(Exception):
         self.error = rpc_error
 
 
-def EncodeDecimal(o):
-    if isinstance(o, decimal.Decimal):
-        return round(o, 8)
-    raise TypeError(repr(o) + " is not JSON serializable")
-
 class AuthServiceProxy(object):
     __id_count = 0
+    __id_lock = threading.Lock()
     hostname = ""
 
-    def __init__(self, service_url, service_name=None, timeout=HTTP_TIMEOUT, connection=None):
+    def __init__(self, service_url, service_name=None, timeout=HTTP_TIMEOUT, pool=None, pool_size=POOL_SIZE,
+                 codec=DECIMAL_CODEC, cache=None, flights=None, compression=True, traffic=None):
         self.__service_url = service_url
         self.__service_name = service_name
+        self.__codec = codec
+        self.__cache = cache
+        self.__compression = compression
+        self.__traffic = traffic
         self.__url = urlparse.urlparse(service_url)
         self.hostname = self.__url.hostname
         if self.__url.port is None:
@@ -88,17 +109,15 @@ class AuthServiceProxy(object):
             pass
         authpair = user + b':' + passwd
         self.__auth_header = b'Basic ' + base64.b64encode(authpair)
+        if traffic is not None:
+            self.__node = traffic.node_label(self.__url.netloc)
 
-        if connection:
-            # Callables re-use the connection of the original proxy
-            self.__conn = connection
-        elif self.__url.scheme == 'https':
-            self.__conn = httplib.HTTPSConnection(self.__url.hostname, port,
-                                                  None, None, False,
-                                                  timeout)
+        if pool:
+            # Callables re-use the connection pool of the original proxy
+            self.__pool = pool
         else:
-            self.__conn = httplib.HTTPConnection(self.__url.hostname, port,
-                                                 False, timeout)
+            self.__pool = ConnectionPool(self.__url.scheme, self.__url.hostname, port, timeout, pool_size)
+        self.__flights = flights or SingleFlight()
 
     def __getattr__(self, name):
         if name.startswith('__') and name.endswith('__'):
@@ -106,46 +125,118 @@ class AuthServiceProxy(object):
             raise AttributeError
         if self.__service_name is not None:
             name = "%s.%s" % (self.__service_name, name)
-        return AuthServiceProxy(self.__service_url, name, connection=self.__conn)
+        return AuthServiceProxy(self.__service_url, name, pool=self.__pool, codec=self.__codec, cache=self.__cache,
+                                flights=self.__flights, compression=self.__compression, traffic=self.__traffic)
+
+    def _request(self, method, path, postdata, idempotent=False):
+        return self._decode(self._request_raw(method, path, postdata, idempotent))
+
+    def _request_raw(self, method, path, postdata, idempotent=False):
+        name = "MC " + (self.__service_name or "batch")
+        start = time.time()
+        try:
+            if self.__traffic is not None:
+                status, responsedata = self.__traffic.exchange(self.__node, method, path, postdata, idempotent,
+                                                               lambda: self._exchange(method, path, postdata,
+                                                                                      idempotent))
+            else:
+                status, responsedata = self._exchange(method, path, postdata, idempotent)
+        except:
+            CALL_STATS.record(name, time.time() - start, len(postdata), 0, error=True)
+            raise
+        finally:
+            if not idempotent:
+                # Even failed, it may have changed the node state: don't follow reads started before it
+                self.__flights.wrote()
+        # Failed calls get HTTP status 500
+        CALL_STATS.record(name, time.time() - start, len(postdata), len(responsedata), error=status != 200)
+        return responsedata
 
-    def _request(self, method, path, postdata):
+    def _exchange(self, method, path, postdata, idempotent):
         '''
-        Do a HTTP request, with retry if we get disconnected (e.g. due to a timeout).
-        This is a workaround for https://bugs.python.org/issue3566 which is fixed in Python 3.5.
+        Do a HTTP request, with retry if we get disconnected (see ConnectionPool.exchange), and return the
+        response status and body. Only idempotent requests are sent again if they may have already reached the node.
         '''
         headers = {'Host': self.__url.hostname,
                    'User-Agent': USER_AGENT,
                    'Authorization': self.__auth_header,
                    'Content-type': 'application/json'}
+        if self.__compression:
+            headers['Accept-Encoding'] = ACCEPT_ENCODING
+        conn = self.__pool.acquire()
         try:
-            self.__conn.request(method, path, postdata, headers)
-            return self._get_response()
-        except Exception as e:
-            # If connection was closed, try again.
-            # Python 2.7 error message was changed in https://github.com/python/cpython/pull/2825
-            # Python 3.5+ raises BrokenPipeError instead of BadStatusLine when the connection was reset.
-            # ConnectionResetError happens on FreeBSD with Python 3.4.
-            # These classes don't exist in Python 2.x, so we can't refer to them directly.
-            if ((isinstance(e, httplib.BadStatusLine)
-                    and e.line in ("''", "No status line received - the server has closed the connection"))
-                or e.__class__.__name__ in ('BrokenPipeError', 'ConnectionResetError')
-                or (e.__class__.__name__ == "error" and (e.errno == 10053 or e.errno == 10054))):
-                self.__conn.close()
-                self.__conn.request(method, path, postdata, headers)
-                return self._get_response()
-            else:
-                raise
+            response = self._send(conn, method, path, postdata, headers, idempotent)
+        except:
+            self.__pool.discard(conn)
+            raise
+        self.__pool.release(conn)
+        return response
+
+    def _send(self, conn, method, path, postdata, headers, idempotent=False):
+        http_response = self.__pool.exchange(conn, method, path, postdata, headers, idempotent)
+        return http_response.status, self._get_response(http_response)
+
+    @staticmethod
+    def _next_id():
+        with AuthServiceProxy.__id_lock:
+            AuthServiceProxy.__id_count += 1
+            return AuthServiceProxy.__id_count
+
+    def _flight_timeout(self):
+        '''
+        Return how long a coalesced call may wait for the request in flight: the HTTP timeout of the proxy, capped by
+        the deadline active in the calling thread (see deadline.py).
+        '''
+        timeout = self.__pool.timeout
+        active = current_deadline()
+        if active is not None:
+            timeout = min(timeout, active.remaining())
+        return timeout
+
+    def _cache_key(self, args):
+        '''
+        Return (key, volatile) if the call can be served from the cache, (None, False) otherwise.
+        Only calls by hash are cached, per node: whether a node has a block or transaction is what tests check.
+        Verbose results also depend on the node chain tip, so they are volatile (see responsecache.py).
+        '''
+        verbose = MC_CACHEABLE_METHODS.get(self.__service_name)
+        if self.__cache is None or verbose is None or not args or not is_hash(args[0]):
+            return None, False
+        if len(args) > 1:
+            verbose = bool(args[1])
+        return (self.__url.netloc, self.__service_name, self.__codec.encode(list(args))), verbose
 
     def __call__(self, *args):
-        AuthServiceProxy.__id_count += 1
+        request_id = AuthServiceProxy._next_id()
 
-        log.debug("-%s-> %s %s"%(AuthServiceProxy.__id_count, self.__service_name,
+        log.debug("-%s-> %s %s"%(request_id, self.__service_name,
                                  json.dumps(args, default=EncodeDecimal)))
-        postdata = json.dumps({'version': '1.1',
-                               'method': self.__service_name,
-                               'params': args,
-                               'id': AuthServiceProxy.__id_count}, default=EncodeDecimal)
-        response = self._request('POST', self.__url.path, postdata)
+        cache_key, volatile = self._cache_key(args)
+        responsedata = self.__cache.get(cache_key) if cache_key is not None else None
+        if responsedata is not None:
+            response = self._decode(responsedata)
+        else:
+            postdata = self.__codec.encode({'version': '1.1',
+                                            'method': self.__service_name,
+                                            'params': args,
+                                            'id': request_id})
+            if self.__service_name in MC_IDEMPOTENT_METHODS:
+                # Requests differ only by id: coalesce on method and params
+                flight_key = (self.__service_name, self.__codec.encode(list(args)))
+                timeout = self._flight_timeout()
+                stalled = lambda: socket.timeout("%s stalled: no response within %.3fs" % (self.__service_name,
+                                                                                          timeout))
+                responsedata = self.__flights.do(flight_key,
+                                                 lambda: self._request_raw('POST', self.__url.path, postdata, True),
+                                                 timeout, stalled)
+            else:
+                responsedata = self._request_raw('POST', self.__url.path, postdata)
+            response = self._decode(responsedata)
+            if response.get('error') is None and self.__cache is not None:
+                if cache_key is not None:
+                    self.__cache.put(cache_key, responsedata, volatile)
+                elif self.__service_name in MC_CHAIN_CHANGING_METHODS:
+                    self.__cache.invalidate_volatile()
         if response['error'] is not None:
             raise JSONRPCException(response['error'])
         elif 'result' not in response:
@@ -155,20 +246,94 @@ class AuthServiceProxy(object):
             return response['result']
 
     def _batch(self, rpc_call_list):
-        postdata = json.dumps(list(rpc_call_list), default=EncodeDecimal)
-        log.debug("--> "+postdata)
-        return self._request('POST', self.__url.path, postdata)
+        rpc_call_list = list(rpc_call_list)
+        postdata = self.__codec.encode(rpc_call_list)
+        log.debug("--> %s" % postdata)
+        idempotent = all(call['method'] in MC_IDEMPOTENT_METHODS for call in rpc_call_list)
+        try:
+            return self._request('POST', self.__url.path, postdata, idempotent)
+        finally:
+            if self.__cache is not None and any(call['method'] in MC_CHAIN_CHANGING_METHODS
+                                                for call in rpc_call_list):
+                self.__cache.invalidate_volatile()
 
-    def _get_response(self):
-        http_response = self.__conn.getresponse()
+    def _get_response(self, http_response):
         if http_response is None:
             raise JSONRPCException({
                 'code': -342, 'message': 'missing HTTP response from server'})
+        return response_body(http_response).read()
 
-        responsedata = http_response.read().decode('utf8')
-        response = json.loads(responsedata, parse_float=decimal.Decimal)
+    def _decode(self, responsedata):
+        response = self.__codec.decode(responsedata)
         if "error" in response and response["error"] is None:
             log.debug("<-%s- %s"%(response["id"], json.dumps(response["result"], default=EncodeDecimal)))
         else:
-            log.debug("<-- "+responsedata)
+            log.debug("<-- "+responsedata.decode('utf8'))
         return response
+
+
+class JSONRPCBatch(object):
+    """
+    Queue JSON-RPC calls to a single node and send them as batch requests, one HTTP round trip per
+    max_batch_size calls. Queued calls return their request id; results are looked up by that id:
+
+        batch = JSONRPCBatch(node)
+        ids = [batch.getblock(block_hash) for block_hash in block_hashes]
+        batch.execute()
+        blocks = [batch.result(request_id) for request_id in ids]
+
+    A failed entry does not fail the whole batch: execute() stores a JSONRPCException for it, result() raises it.
+    """
+
+    def __init__(self, proxy, max_batch_size=MAX_BATCH_SIZE):
+        self.__proxy = proxy
+        self.__max_batch_size = max_batch_size
+        self.__calls = []
+        self.__results = {}
+
+    def __getattr__(self, name):
+        if name.startswith('__') and name.endswith('__'):
+            # Python internal stuff
+            raise AttributeError
+        return lambda *args: self.add(name, *args)
+
+    def __len__(self):
+        return len(self.__calls)
+
+    def add(self, method, *args):
+        request_id = AuthServiceProxy._next_id()
+        self.__calls.append({'version': '1.1',
+                             'method': method,
+                             'params': args,
+                             'id': request_id})
+        return request_id
+
+    def execute(self):
+        """
+        Send all the queued calls, return a dict request id -> result (or JSONRPCException).
+        """
+        calls, self.__calls = self.__calls, []
+        for start in range(0, len(calls), self.__max_batch_size):
+            chunk = calls[start:start + self.__max_batch_size]
+            response = self.__proxy._batch(chunk)
+            if not isinstance(response, list):
+                # The whole batch was rejected
+                raise JSONRPCException(response.get('error') or {
+                    'code': -344, 'message': 'unexpected JSON-RPC batch response'})
+            by_id = dict((entry.get('id'), entry) for entry in response)
+            for call in chunk:
+                entry = by_id.get(call['id'])
+                if entry is not None and entry.get('error') is not None:
+                    self.__results[call['id']] = JSONRPCException(entry['error'])
+                elif entry is None or 'result' not in entry:
+                    self.__results[call['id']] = JSONRPCException({
+                        'code': -343, 'message': 'missing JSON-RPC result'})
+                else:
+                    self.__results[call['id']] = entry['result']
+        return self.__results
+
+    def result(self, request_id):
+        result = self.__results[request_id]
+        if isinstance(result, JSONRPCException):
+            raise result
+        return result
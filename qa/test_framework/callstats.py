@@ -0,0 +1,175 @@
+"""
+Per-method statistics of the requests sent to the nodes: call and error counts, latency histogram (p50, p90, p99,
+max) and request/response sizes, keyed by "MC <rpc method>" and "SC <route>".
+
+AuthServiceProxy and SidechainAuthServiceProxy record every request actually sent (cache hits and coalesced calls
+are not requests) into the shared CALL_STATS; SidechainTestFramework prints the summary table at exit and can
+dump it to JSON (--callstats).
+
+The durations of waits on the nodes, which are not requests (syncs and other waits of wait.py, node readiness,
+certificate arrival), are recorded apart in WAIT_STATS: count, timeouts and latency histogram per operation,
+printed in their own table and dumped with --waitstats.
+"""
+
+import json
+import math
+import threading
+
+# Latency histogram buckets: bucket 0 holds latencies up to MIN_LATENCY, bucket n up to MIN_LATENCY * GROWTH ** n,
+# so percentiles are reported with less than 5% of error.
+MIN_LATENCY = 0.00001
+GROWTH = 1.05
+
+
+class LatencyHistogram(object):
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, latency):
+        if latency <= MIN_LATENCY:
+            bucket = 0
+        else:
+            bucket = int(math.ceil(math.log(latency / MIN_LATENCY, GROWTH)))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def percentile(self, p):
+        if self.count == 0:
+            return 0.0
+        rank = max(1, int(math.ceil(self.count * p / 100.0)))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(MIN_LATENCY * GROWTH ** bucket, self.max)
+        return self.max
+
+
+class _MethodStats(object):
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.errors = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+
+class _OperationStats(object):
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.timeouts = 0
+
+
+class CallStats(object):
+
+    def __init__(self):
+        self.__methods = {}
+        self.__lock = threading.Lock()
+
+    def record(self, name, latency, request_bytes, response_bytes, error=False):
+        with self.__lock:
+            stats = self.__methods.get(name)
+            if stats is None:
+                stats = self.__methods[name] = _MethodStats()
+            stats.latency.add(latency)
+            stats.request_bytes += request_bytes
+            stats.response_bytes += response_bytes
+            if error:
+                stats.errors += 1
+
+    def reset(self):
+        with self.__lock:
+            self.__methods.clear()
+
+    def summary(self):
+        """
+        Return the statistics of every method, the most time consuming first. Times are in seconds.
+        """
+        with self.__lock:
+            rows = [{"method": name,
+                     "calls": stats.latency.count,
+                     "errors": stats.errors,
+                     "total": stats.latency.total,
+                     "p50": stats.latency.percentile(50),
+                     "p90": stats.latency.percentile(90),
+                     "p99": stats.latency.percentile(99),
+                     "max": stats.latency.max,
+                     "request_bytes": stats.request_bytes,
+                     "response_bytes": stats.response_bytes}
+                    for (name, stats) in self.__methods.items()]
+        return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+    def format_table(self):
+        lines = ["{0:<40} {1:>7} {2:>6} {3:>9} {4:>8} {5:>8} {6:>8} {7:>8} {8:>10} {9:>11}".format(
+            "method", "calls", "errors", "total s", "p50 ms", "p90 ms", "p99 ms", "max ms", "req B/call",
+            "resp B/call")]
+        for row in self.summary():
+            lines.append("{0:<40} {1:>7} {2:>6} {3:>9.3f} {4:>8.2f} {5:>8.2f} {6:>8.2f} {7:>8.2f} {8:>10} {9:>11}".format(
+                row["method"], row["calls"], row["errors"], row["total"], row["p50"] * 1000, row["p90"] * 1000,
+                row["p99"] * 1000, row["max"] * 1000, row["request_bytes"] // row["calls"],
+                row["response_bytes"] // row["calls"]))
+        return "\n".join(lines)
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+class WaitStats(object):
+
+    def __init__(self):
+        self.__operations = {}
+        self.__lock = threading.Lock()
+
+    def record(self, name, elapsed, timeout=False):
+        with self.__lock:
+            stats = self.__operations.get(name)
+            if stats is None:
+                stats = self.__operations[name] = _OperationStats()
+            stats.latency.add(elapsed)
+            if timeout:
+                stats.timeouts += 1
+
+    def reset(self):
+        with self.__lock:
+            self.__operations.clear()
+
+    def summary(self):
+        """
+        Return the statistics of every operation, the most time consuming first. Times are in seconds.
+        """
+        with self.__lock:
+            rows = [{"operation": name,
+                     "waits": stats.latency.count,
+                     "timeouts": stats.timeouts,
+                     "total": stats.latency.total,
+                     "p50": stats.latency.percentile(50),
+                     "p90": stats.latency.percentile(90),
+                     "p99": stats.latency.percentile(99),
+                     "max": stats.latency.max}
+                    for (name, stats) in self.__operations.items()]
+        return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+    def format_table(self):
+        lines = ["{0:<52} {1:>7} {2:>8} {3:>9} {4:>8} {5:>8} {6:>8} {7:>8}".format(
+            "operation", "waits", "timeouts", "total s", "p50 ms", "p90 ms", "p99 ms", "max ms")]
+        for row in self.summary():
+            lines.append("{0:<52} {1:>7} {2:>8} {3:>9.3f} {4:>8.2f} {5:>8.2f} {6:>8.2f} {7:>8.2f}".format(
+                row["operation"], row["waits"], row["timeouts"], row["total"], row["p50"] * 1000, row["p90"] * 1000,
+                row["p99"] * 1000, row["max"] * 1000))
+        return "\n".join(lines)
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+CALL_STATS = CallStats()
+WAIT_STATS = WaitStats()
@@ -0,0 +1,170 @@
+"""
+Thread-safe pool of persistent (keep-alive) HTTP connections to a single node.
+
+Both AuthServiceProxy and SidechainAuthServiceProxy create one pool per node URL and share it with every
+attribute-derived proxy (e.g. node.getblockcount, sc_node.block_best). Each request borrows a connection for the
+duration of one request/response exchange, so several threads can talk to the same node at once, up to the
+configured pool size; further callers block until a connection is given back.
+
+Connection health:
+ - idle connections are checked before reuse: a connection idle for more than max_idle seconds (below the idle
+   timeouts of the nodes, 30s for zend and 60s for the SC Akka HTTP server) or already closed by the peer is closed
+   and transparently reopened, so a request after a long wait doesn't fail on a dead connection;
+ - exchange() retries requests failing on a lost connection, with exponential backoff and jitter. A request that
+   failed before being sent is always retried, one that may have reached the node only if it is idempotent;
+ - reconnects, refreshes and retries are counted, see stats().
+"""
+
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+import errno
+import random
+import select
+import socket
+import threading
+import time
+
+POOL_SIZE = 4
+
+MAX_IDLE_TIME = 20
+
+RETRIES = 3
+RETRY_BACKOFF = 0.05
+RETRY_BACKOFF_MAX = 2.0
+
+# Not ECONNREFUSED: nothing is listening, e.g. a node still starting, which the readiness waits retry themselves
+_CONNECTION_LOST_ERRNOS = (errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED,
+                           10053, 10054)  # WSAECONNABORTED, WSAECONNRESET
+
+
+def is_connection_lost(e):
+    """
+    Tell if e means that the connection was closed or reset, as opposed to e.g. a timeout or a protocol error.
+    """
+    # Python 2.7 error message was changed in https://github.com/python/cpython/pull/2825
+    # Python 3.5+ raises BrokenPipeError instead of BadStatusLine when the connection was reset.
+    # ConnectionResetError happens on FreeBSD with Python 3.4.
+    if isinstance(e, httplib.BadStatusLine):
+        return e.line in ("''", "No status line received - the server has closed the connection")
+    if isinstance(e, socket.timeout):
+        return False
+    return isinstance(e, (socket.error, EnvironmentError)) and e.errno in _CONNECTION_LOST_ERRNOS
+
+
+class ConnectionPool(object):
+
+    def __init__(self, scheme, host, port, timeout, size=POOL_SIZE, max_idle=MAX_IDLE_TIME, retries=RETRIES):
+        if size < 1:
+            raise ValueError("Connection pool size must be positive, got %s" % size)
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.size = size
+        self.max_idle = max_idle
+        self.retries = retries
+        self.connects = 0
+        self.reconnects = 0
+        self.refreshes = 0
+        self.retried = 0
+        # (connection, release time). LIFO: the most recently used connection is the most likely to be still alive
+        self.__idle = []
+        self.__opened = 0
+        self.__available = threading.Condition(threading.Lock())
+
+    def _new_connection(self):
+        if self.scheme == 'https':
+            return httplib.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def acquire(self):
+        """
+        Borrow a connection, opening a new one if the pool is not full yet, otherwise wait for a free one.
+        """
+        with self.__available:
+            while not self.__idle and self.__opened >= self.size:
+                self.__available.wait()
+            if self.__idle:
+                conn, released = self.__idle.pop()
+            else:
+                self.__opened += 1
+                self.connects += 1
+                return self._new_connection()
+        self._revalidate(conn, released)
+        return conn
+
+    def _revalidate(self, conn, released):
+        """
+        Close an idle connection that is too old or was closed by the peer, it will reconnect on the next request.
+        """
+        if conn.sock is None:
+            return
+        if time.time() - released > self.max_idle:
+            stale = True
+        else:
+            # An idle connection must have nothing to read: EOF or unexpected data both make it unusable
+            try:
+                stale = bool(select.select([conn.sock], [], [], 0)[0])
+            except (select.error, ValueError):
+                stale = True
+        if stale:
+            conn.close()
+            with self.__available:
+                self.refreshes += 1
+                self.connects += 1
+
+    def release(self, conn):
+        """
+        Give back a connection whose last response was fully read, so it can be reused.
+        """
+        with self.__available:
+            self.__idle.append((conn, time.time()))
+            self.__available.notify()
+
+    def discard(self, conn):
+        """
+        Close a connection left in an unknown state (e.g. after an I/O error) and free its slot.
+        """
+        conn.close()
+        with self.__available:
+            self.__opened -= 1
+            self.__available.notify()
+
+    def close(self):
+        with self.__available:
+            idle, self.__idle = self.__idle, []
+            self.__opened -= len(idle)
+            self.__available.notify_all()
+        for conn, released in idle:
+            conn.close()
+
+    def exchange(self, conn, method, path, postdata, headers, idempotent):
+        """
+        Send a request on a borrowed connection and return the HTTPResponse, retrying on a lost connection.
+        """
+        attempt = 0
+        while True:
+            sent = False
+            try:
+                conn.request(method, path, postdata, headers)
+                sent = True
+                return conn.getresponse()
+            except Exception as e:
+                if attempt >= self.retries or not is_connection_lost(e) or (sent and not idempotent):
+                    raise
+            conn.close()
+            # The first retry goes right away: most of the times the node just closed a kept-alive connection
+            if attempt > 0:
+                time.sleep(random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt)))
+            attempt += 1
+            with self.__available:
+                self.retried += 1
+                self.reconnects += 1
+                self.connects += 1
+
+    def stats(self):
+        with self.__available:
+            return {"connects": self.connects, "reconnects": self.reconnects, "refreshes": self.refreshes,
+                    "retries": self.retried, "idle": len(self.__idle), "opened": self.__opened}
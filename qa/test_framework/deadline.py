@@ -0,0 +1,86 @@
+"""
+Overall deadlines for sequences of node API calls. A deadline is active for the current thread inside a
+"with within(seconds):" block: every request issued meanwhile gets at most the remaining time as timeout, and
+fails right away once the deadline has expired. Nested deadlines can only shorten the enclosing one.
+
+    with within(120, "forging 10 blocks"):
+        generate_next_blocks(sc_node, "first node", 10)
+
+Helpers taking a deadline parameter (seconds or None) wrap their calls this way. Work handed to other threads
+runs under the deadline of the caller with "with using(deadline):".
+"""
+
+from contextlib import contextmanager
+import threading
+import time
+
+_local = threading.local()
+
+
+class RequestTimeout(Exception):
+    """
+    Base of the exceptions of the requests given up on their timeout, which the deadline may have shortened.
+    """
+
+
+class Deadline(object):
+
+    def __init__(self, seconds, operation=None):
+        self.seconds = seconds
+        self.operation = operation
+        self.expires_at = time.time() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self):
+        return time.time() >= self.expires_at
+
+    def __str__(self):
+        return "%ss deadline%s" % (self.seconds, " of " + self.operation if self.operation else "")
+
+
+def current_deadline():
+    """
+    Return the innermost Deadline active in the current thread, None if there is none.
+    """
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def within(seconds, operation=None):
+    """
+    Make a deadline of seconds from now active in the block, seconds None meaning no (additional) deadline.
+    """
+    enclosing = current_deadline()
+    if seconds is None:
+        yield enclosing
+        return
+    new = Deadline(seconds, operation)
+    if enclosing is not None and enclosing.expires_at < new.expires_at:
+        new = enclosing
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    _local.stack.append(new)
+    try:
+        yield new
+    finally:
+        _local.stack.pop()
+
+
+@contextmanager
+def using(deadline):
+    """
+    Make the given Deadline (e.g. current_deadline() of another thread) active in the block, None meaning none.
+    """
+    if deadline is None:
+        yield None
+        return
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    _local.stack.append(deadline)
+    try:
+        yield deadline
+    finally:
+        _local.stack.pop()
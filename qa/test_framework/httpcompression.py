@@ -0,0 +1,68 @@
+"""
+HTTP response compression support for the proxies: they send ACCEPT_ENCODING with every request and read the
+response through response_body(), which decompresses gzip/deflate bodies on the fly, chunk by chunk, so streamed
+responses (see jsonstream.py) are never held in memory in compressed nor in decompressed form.
+Nodes that don't compress their responses are not affected.
+"""
+
+import zlib
+
+ACCEPT_ENCODING = "gzip, deflate"
+
+CHUNK_SIZE = 64 * 1024
+
+
+class DecompressingReader(object):
+    """
+    File-like object returning the decompressed content of a gzip or deflate encoded file-like object.
+    """
+
+    def __init__(self, fp, encoding, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        # Bytes read from fp, i.e. the size of the body on the wire
+        self.wire_bytes = 0
+        self.__decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS)
+        self.__buffer = b''
+        self.__eof = False
+
+    def _decompress_next(self):
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.__eof = True
+            return self.__decompressor.flush()
+        first = self.wire_bytes == 0
+        self.wire_bytes += len(chunk)
+        try:
+            return self.__decompressor.decompress(chunk)
+        except zlib.error:
+            if not (first and self.encoding == "deflate"):
+                raise
+            # Some servers send raw deflate data without the zlib header
+            self.__decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self.__decompressor.decompress(chunk)
+
+    def read(self, amt=None):
+        if amt is None or amt < 0:
+            chunks = [self.__buffer]
+            while not self.__eof:
+                chunks.append(self._decompress_next())
+            self.__buffer = b''
+            return b''.join(chunks)
+        while len(self.__buffer) < amt and not self.__eof:
+            self.__buffer += self._decompress_next()
+        data, self.__buffer = self.__buffer[:amt], self.__buffer[amt:]
+        return data
+
+
+def response_body(http_response):
+    """
+    Return a file-like object reading the decoded body of http_response: the response itself if not compressed.
+    """
+    encoding = (http_response.getheader("Content-Encoding") or "identity").strip().lower()
+    if encoding in ("gzip", "x-gzip"):
+        return DecompressingReader(http_response, "gzip")
+    if encoding == "deflate":
+        return DecompressingReader(http_response, "deflate")
+    return http_response
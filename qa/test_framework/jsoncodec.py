@@ -0,0 +1,116 @@
+"""
+JSON codecs used by AuthServiceProxy and SidechainAuthServiceProxy to encode request bodies and decode responses.
+
+ - DecimalJSONCodec ("decimal", default): numbers with a fraction or exponent are parsed as Decimal and Decimals are
+   encoded rounded to 8 digits, as check_json_precision requires for MC amounts. Uses simplejson speedups when
+   simplejson is importable, stdlib json otherwise: both parse Decimals exactly.
+ - IntegerJSONCodec ("integer"): for SC responses, where all amounts are satoshi integers. No Decimal is built and
+   any non-integer number is rejected with a ValueError, so precision can never be lost silently.
+ - FastJSONCodec ("fast"): integer mode on an accelerated backend (orjson or ujson) when one is importable.
+   These backends cannot hook float parsing, so non-integer numbers come back as float: use it only for
+   payloads known to be integer-only (SC API). Falls back to IntegerJSONCodec if no backend is available.
+
+decode() takes the raw response body bytes, encode() returns the request body.
+"""
+
+import decimal
+import json
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def EncodeDecimal(o):
+    if isinstance(o, decimal.Decimal):
+        return round(o, 8)
+    raise TypeError(repr(o) + " is not JSON serializable")
+
+
+def _reject_float(value):
+    raise ValueError("Non-integer number %s in an integer-only JSON payload" % value)
+
+
+class JSONCodec(object):
+    name = None
+    backend = None
+
+    def encode(self, obj):
+        raise NotImplementedError
+
+    def decode(self, data):
+        raise NotImplementedError
+
+
+class DecimalJSONCodec(JSONCodec):
+    name = "decimal"
+    backend = "simplejson" if simplejson is not None else "json"
+
+    def encode(self, obj):
+        return json.dumps(obj, default=EncodeDecimal)
+
+    def decode(self, data):
+        if simplejson is not None:
+            return simplejson.loads(data, use_decimal=True)
+        return json.loads(data.decode('utf8'), parse_float=decimal.Decimal)
+
+
+class IntegerJSONCodec(JSONCodec):
+    name = "integer"
+    backend = "json"
+
+    def encode(self, obj):
+        return json.dumps(obj)
+
+    def decode(self, data):
+        return json.loads(data.decode('utf8'), parse_float=_reject_float)
+
+
+class FastJSONCodec(JSONCodec):
+    name = "fast"
+
+    if orjson is not None:
+        backend = "orjson"
+
+        def encode(self, obj):
+            return orjson.dumps(obj)
+
+        def decode(self, data):
+            return orjson.loads(data)
+    else:
+        backend = "ujson"
+
+        def encode(self, obj):
+            return ujson.dumps(obj)
+
+        def decode(self, data):
+            return ujson.loads(data)
+
+
+DECIMAL_CODEC = DecimalJSONCodec()
+INTEGER_CODEC = IntegerJSONCodec()
+FAST_CODEC = FastJSONCodec() if orjson is not None or ujson is not None else INTEGER_CODEC
+
+CODECS = {
+    DECIMAL_CODEC.name: DECIMAL_CODEC,
+    INTEGER_CODEC.name: INTEGER_CODEC,
+    "fast": FAST_CODEC,
+}
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError("Unknown JSON codec %s, expected one of %s" % (name, ", ".join(sorted(CODECS))))
@@ -0,0 +1,237 @@
+"""
+Incremental extraction of the elements of one JSON array out of a large JSON document, read chunk by chunk from
+a file-like object (e.g. an HTTP response), without materializing the whole document.
+
+    for box in iter_json_array(http_response, "result.boxes", codec.decode):
+        ...
+
+The array is selected by a path of object member names ("result.block.mainchainBlockReferencesData" or a
+sequence of names). Only the elements completely contained in the current chunk are kept in memory: they are
+decoded together with the given decode function (taking the bytes of a JSON array), yielded and dropped.
+Members outside the path are skipped without being decoded.
+"""
+
+import re
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(br'[ \t\r\n]*')
+# The characters of a string up to its closing quote, or up to the end of the buffer (a trailing lone backslash
+# excluded, the escaped character is not read yet)
+_STRING_CHARS = re.compile(br'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+_STRUCTURAL = re.compile(br'[\[\]{}"]')
+_SCALAR_END = re.compile(br'[,\]} \t\r\n]')
+
+
+class JSONStreamError(Exception):
+    def __init__(self, message, error=None):
+        Exception.__init__(self, message)
+        # Decoded top level "error" member, if the document had one instead of the selected path
+        self.error = error
+
+
+class _IncompleteInput(Exception):
+    pass
+
+
+class _ValueScan(object):
+    """
+    Resumable search of the end of the JSON value starting at some offset of a buffer that grows by chunks: the
+    progress (bytes scanned, nesting depth, inside a string or not) is kept across refills, so every byte of a
+    large value is scanned once.
+    """
+
+    def __init__(self):
+        self.scanned = 0  # From the start of the value
+        self.scalar = None
+        self.depth = 0
+        self.in_string = False
+
+    def end(self, buf, pos):
+        """
+        Return the offset just after the value starting at pos, raise _IncompleteInput if buf ends before it.
+        """
+        i = pos + self.scanned
+        if self.scalar is None:
+            first = buf[pos:pos + 1]
+            if not first:
+                raise _IncompleteInput()
+            self.scalar = first not in (b'"', b'{', b'[')
+            if not self.scalar:
+                # A string is scanned as a container of depth 0
+                self.in_string = first == b'"'
+                self.depth = 0 if self.in_string else 1
+                i += 1
+        if self.scalar:
+            match = _SCALAR_END.search(buf, i)
+            if match is None:
+                self.scanned = len(buf) - pos
+                raise _IncompleteInput()
+            return match.start()
+        while True:
+            if self.in_string:
+                i = _STRING_CHARS.match(buf, i).end()
+                if buf[i:i + 1] != b'"':
+                    self.scanned = i - pos
+                    raise _IncompleteInput()
+                i += 1
+                self.in_string = False
+                if self.depth == 0:
+                    return i
+                continue
+            match = _STRUCTURAL.search(buf, i)
+            if match is None:
+                self.scanned = len(buf) - pos
+                raise _IncompleteInput()
+            char = match.group()
+            i = match.end()
+            if char == b'"':
+                self.in_string = True
+            elif char in (b'{', b'['):
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    return i
+
+
+def _value_end(buf, pos):
+    """
+    Return the offset just after the JSON value starting at pos, raise _IncompleteInput if buf ends before it.
+    """
+    return _ValueScan().end(buf, pos)
+
+
+class _Reader(object):
+
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = b''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            raise JSONStreamError("Unexpected end of JSON document")
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            # A trailing scalar may be terminated only by the end of the document
+            chunk = b' '
+        if self.pos > 0:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        self.buf += chunk
+
+    def next_char(self):
+        """
+        Consume whitespace and return the next significant character, without consuming it.
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, char):
+        found = self.next_char()
+        if found != char:
+            raise JSONStreamError("Expected %r but found %r in JSON document" % (char, found))
+        self.pos += 1
+
+    def read_value(self):
+        """
+        Consume the next value and return its bytes.
+        """
+        self.next_char()
+        scan = _ValueScan()
+        while True:
+            try:
+                end = scan.end(self.buf, self.pos)
+                break
+            except _IncompleteInput:
+                self._fill()
+        value = self.buf[self.pos:end]
+        self.pos = end
+        return value
+
+    def read_elements(self):
+        """
+        Consume the array elements already buffered (reading more only if there is not even one) and return them
+        as the bytes of a JSON array, with a flag telling if the end of the array was reached.
+        """
+        char = self.next_char()
+        if char == b']':
+            self.pos += 1
+            return b'[]', True
+        if char == b',':
+            self.pos += 1
+            self.next_char()
+        # Kept across refills while not even the first element is complete
+        first_scan = _ValueScan()
+        while True:
+            start = pos = self.pos
+            end = None
+            try:
+                while True:
+                    end = (first_scan if end is None else _ValueScan()).end(self.buf, pos)
+                    pos = _WHITESPACE.match(self.buf, end).end()
+                    separator = self.buf[pos:pos + 1]
+                    if separator == b']':
+                        self.pos = pos + 1
+                        return b'[' + self.buf[start:end] + b']', True
+                    if not separator:
+                        break
+                    if separator != b',':
+                        raise JSONStreamError("Expected ',' or ']' but found %r in JSON document" % separator)
+                    pos = _WHITESPACE.match(self.buf, pos + 1).end()
+                    if pos == len(self.buf):
+                        break
+            except _IncompleteInput:
+                pass
+            if end is not None:
+                self.pos = end
+                return b'[' + self.buf[start:end] + b']', False
+            self._fill()
+
+
+def _split_path(path):
+    if isinstance(path, (tuple, list)):
+        return list(path)
+    return path.split(".") if path else []
+
+
+def iter_json_array(fp, path, decode, chunk_size=CHUNK_SIZE):
+    """
+    Yield the decoded elements of the array found at path in the JSON document read from fp.
+    Raise JSONStreamError if the document is malformed or has no array at path.
+    """
+    reader = _Reader(fp, chunk_size)
+    keys = _split_path(path)
+    error = None
+    for depth, key in enumerate(keys):
+        reader.expect(b'{')
+        found = False
+        if reader.next_char() != b'}':
+            while True:
+                name = decode(reader.read_value())
+                reader.expect(b':')
+                if name == key:
+                    found = True
+                    break
+                value = reader.read_value()
+                if depth == 0 and name == "error":
+                    error = decode(value)
+                if reader.next_char() == b'}':
+                    break
+                reader.expect(b',')
+        if not found:
+            raise JSONStreamError("No member %s in JSON document" % ".".join(keys[:depth + 1]), error)
+
+    reader.expect(b'[')
+    closed = False
+    while not closed:
+        elements, closed = reader.read_elements()
+        for element in decode(elements):
+            yield element
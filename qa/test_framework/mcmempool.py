@@ -0,0 +1,67 @@
+"""
+Watch the MC mempool for the arrival of given transactions or certificates, e.g. the withdrawal certificate a
+sidechain sends once the epoch is over:
+
+    cert_hash, delay = wait_for_certificate(mc_node, scid, 0, epoch_end_time=epoch_end_time)
+
+The mempool is polled with the adaptive delays of wait.py, from a few milliseconds up to MAX_POLL_DELAY, and
+every new entry is checked once only. The time from the end of the epoch to the arrival of the certificate is
+printed and recorded in WAIT_STATS as "CERT epoch end to mempool".
+"""
+
+import time
+
+from authproxy import JSONRPCException
+from callstats import WAIT_STATS
+from wait import wait_until
+
+MAX_POLL_DELAY = 0.05
+
+
+def wait_for_mempool(node, predicate, timeout=200, operation="Waiting MC mempool entries", max_delay=MAX_POLL_DELAY):
+    """
+    Wait for maximum timeout seconds for entries (transactions or certificates) satisfying predicate(node, id)
+    to be in the mempool of node, predicate being called once per entry.
+    Return the ids of the matching entries, in mempool order, and the elapsed seconds.
+    """
+    checked = {}
+    found = []
+
+    def arrived():
+        ids = node.getrawmempool()
+        for entry_id in ids:
+            if entry_id not in checked:
+                checked[entry_id] = predicate(node, entry_id)
+        found[:] = [entry_id for entry_id in ids if checked[entry_id]]
+        return len(found) > 0
+    elapsed = wait_until(arrived, timeout, operation, max_delay)
+    return found, elapsed
+
+
+def is_certificate(scid, epoch_number=None):
+    """
+    Return a predicate for wait_for_mempool matching the certificates of sidechain scid (for epoch_number).
+    """
+    def matches(node, entry_id):
+        try:
+            cert = node.getrawcertificate(entry_id, 1)["cert"]
+        except JSONRPCException:
+            # A transaction
+            return False
+        return cert["scid"] == scid and (epoch_number is None or cert["epochNumber"] == epoch_number)
+    return matches
+
+
+def wait_for_certificate(node, scid, epoch_number, timeout=200, epoch_end_time=None):
+    """
+    Wait for maximum timeout seconds for the certificate of sidechain scid for epoch_number to be in the mempool
+    of node. Return its hash and the seconds it took to arrive: since epoch_end_time (time.time() at the end of the
+    epoch) if given, else since the call.
+    """
+    found, elapsed = wait_for_mempool(node, is_certificate(scid, epoch_number), timeout,
+                                      "Waiting certificate for epoch {0}".format(epoch_number))
+    if epoch_end_time is not None:
+        elapsed = time.time() - epoch_end_time
+        WAIT_STATS.record("CERT epoch end to mempool", elapsed)
+    print("Certificate {0} for epoch {1} in MC mempool after {2:.3f}s".format(found[0], epoch_number, elapsed))
+    return found[0], elapsed
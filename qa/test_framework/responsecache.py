@@ -0,0 +1,125 @@
+"""
+Opt-in LRU cache of raw responses for content-addressed node API calls, capped by the total size of the cached
+response bodies. Responses are cached as bytes and decoded again on every hit, so callers can never alter each
+other's results.
+
+What is cached and for how long:
+ - SC block/findById and mainchain/blockReferenceByHash (SC_CACHEABLE_ROUTES): a block or MC block reference with
+   a given id never changes, the entry lives until evicted. Error responses (e.g. block not found yet) are not
+   cached.
+ - MC getblock/getrawtransaction/getrawcertificate called with a hash (MC_CACHEABLE_METHODS; heights are never
+   cached). Non verbose (hex) results never change and live until evicted. Verbose results contain chain dependent
+   fields (confirmations, nextblockhash, blockhash), so they are cached as volatile entries, dropped as soon as any
+   proxy sharing the cache issues a chain changing call (MC_CHAIN_CHANGING_METHODS, also in batches), and whenever
+   a node chain may have changed without such a call: on a tip event of any node (websocketclient.TipListener),
+   when MC nodes are connected and once sync_blocks has brought them to the same height.
+ - clear() drops everything, e.g. when nodes are restarted with a different chain.
+
+The framework shares one cache among all the nodes started by start_nodes/start_sc_nodes once
+enable_response_cache() was called (see --apicachesize in SidechainTestFramework). The proxies key the entries by
+node address as well, so a call is only ever served what the same node answered before: a block or transaction
+known to one node says nothing about the others until they have synced.
+"""
+
+from collections import OrderedDict
+import re
+import threading
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+SC_CACHEABLE_ROUTES = frozenset(["/block/findById", "/mainchain/blockReferenceByHash"])
+
+# Method name -> default verbosity
+MC_CACHEABLE_METHODS = {"getblock": True, "getrawtransaction": False, "getrawcertificate": False}
+
+MC_CHAIN_CHANGING_METHODS = frozenset(["generate", "submitblock", "invalidateblock", "reconsiderblock"])
+
+_HASH = re.compile(r'^[0-9a-fA-F]{64}$')
+
+
+def is_hash(value):
+    try:
+        return _HASH.match(value) is not None
+    except TypeError:
+        return False
+
+
+class ResponseCache(object):
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.__entries = OrderedDict()  # key -> (data, volatile), least recently used first
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.__entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, data, volatile=False):
+        if len(data) > self.max_bytes:
+            return
+        with self.__lock:
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[0])
+            self.__entries[key] = (data, volatile)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                evicted_data, evicted_volatile = self.__entries.popitem(last=False)[1]
+                self.size -= len(evicted_data)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry[0])
+                self.invalidations += 1
+
+    def invalidate_volatile(self):
+        """
+        Drop all the entries that depend on the current chain tip.
+        """
+        with self.__lock:
+            for key in [key for (key, (data, volatile)) in self.__entries.items() if volatile]:
+                self.size -= len(self.__entries.pop(key)[0])
+                self.invalidations += 1
+
+    def clear(self):
+        with self.__lock:
+            self.invalidations += len(self.__entries)
+            self.__entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.__lock:
+            return {"entries": len(self.__entries), "bytes": self.size, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "invalidations": self.invalidations}
+
+
+_shared_cache = None
+
+
+def enable_response_cache(max_bytes=DEFAULT_MAX_BYTES):
+    global _shared_cache
+    _shared_cache = ResponseCache(max_bytes)
+    return _shared_cache
+
+
+def get_response_cache():
+    """
+    Return the cache shared by the nodes started by the framework, None if caching is disabled.
+    """
+    return _shared_cache
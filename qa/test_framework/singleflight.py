@@ -0,0 +1,101 @@
+"""
+Single-flight coalescing of identical idempotent requests to a node: while a request is in flight, the threads
+issuing the same request (same node, path and body) wait for its response instead of sending their own.
+Followers get the raw response body of the leader, so every caller still decodes its own copy of the result.
+
+Only read-only calls are coalesced (SC_IDEMPOTENT_ROUTES, MC_IDEMPOTENT_METHODS): a follower may get a result
+produced by a request started a little before its own call, which is what a poller wants, but is never acceptable
+for a call with side effects.
+
+A caller never follows a request started before a write to the node (a request with side effects, e.g. forging a
+block or sending coins) completed, as its response may predate the write: the proxies report their writes with
+wrote(), and such a caller starts a new request instead, which later callers follow.
+
+A follower waits at most its own timeout (e.g. the route timeout and deadline of the caller) for the leader: a
+caller in a hurry joining a slow request fails on time instead of waiting for the timeout of the leader.
+"""
+
+import threading
+import time
+
+SC_IDEMPOTENT_ROUTES = frozenset([
+    "/block/best", "/block/findById", "/block/findLastIds", "/block/findIdByHeight", "/block/forgingInfo",
+    "/wallet/allBoxes", "/wallet/balance", "/wallet/allPublicKeys",
+    "/transaction/allTransactions", "/transaction/findById",
+    "/node/allPeers", "/node/connectedPeers", "/node/blacklistedPeers",
+    "/mainchain/bestBlockReferenceInfo", "/mainchain/genesisBlockReferenceInfo", "/mainchain/blockReferenceInfoBy",
+    "/mainchain/blockReferenceByHash",
+])
+
+MC_IDEMPOTENT_METHODS = frozenset([
+    "getblockcount", "getbestblockhash", "getblockhash", "getblock", "getblockheader", "getblockchaininfo",
+    "getchaintips", "getrawmempool", "getmempoolinfo", "getrawtransaction", "getrawcertificate", "gettransaction",
+    "getinfo", "getpeerinfo", "getnetworkinfo", "getconnectioncount", "getscinfo", "getbalance", "listunspent",
+])
+
+
+class _Flight(object):
+
+    def __init__(self, writes):
+        self.writes = writes  # Writes completed when the flight started
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self.__writes = 0
+        self.__flights = {}
+        self.__lock = threading.Lock()
+
+    def do(self, key, function, timeout=None, timeout_error=None):
+        """
+        Return function(), or the result of the call already in flight for key. Errors are raised to all callers.
+        A follower waits for maximum timeout seconds (None meaning as long as the leader), then raises
+        timeout_error().
+        """
+        with self.__lock:
+            flight = self.__flights.get(key)
+            leader = flight is None or flight.writes != self.__writes
+            if leader:
+                flight = self.__flights[key] = _Flight(self.__writes)
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            end = time.time() + timeout if timeout is not None else None
+            # Wait in slices, an untimed wait can't be interrupted in Python 2
+            while not flight.done.wait(1 if end is None else max(0.0, min(1, end - time.time()))):
+                if end is not None and time.time() >= end:
+                    raise timeout_error()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        # Reported to the followers if the leader is interrupted by something else than an Exception
+        flight.error = RuntimeError("Coalesced request was interrupted")
+        try:
+            flight.result = function()
+            flight.error = None
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.__lock:
+                # May have been replaced by a flight started after a write
+                if self.__flights.get(key) is flight:
+                    del self.__flights[key]
+            flight.done.set()
+
+    def wrote(self):
+        """
+        Tell that a request with side effects completed: the flights in progress are not followed anymore.
+        """
+        with self.__lock:
+            self.__writes += 1
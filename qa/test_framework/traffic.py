@@ -0,0 +1,271 @@
+"""
+Record/replay of the traffic between the framework and the nodes.
+
+When recording, every request/response exchange of AuthServiceProxy and SidechainAuthServiceProxy (and every run
+of the SC bootstrapping tool) is appended to a traffic file. When replaying, the proxies are served the recorded
+responses and no zend or Java process is launched, so framework changes (checkers, sync logic...) can be run and
+profiled in seconds against a captured session:
+
+    python sc_backward_transfer.py --recordtraffic=/tmp/bt.traffic
+    python sc_backward_transfer.py --replaytraffic=/tmp/bt.traffic
+
+File format: records are appended to <path>, each one made of a ">II" header (metadata length, response length),
+the metadata as JSON (seq, node, method, path, body, status, latency, idempotent) and the raw response body.
+<path>.idx holds one ">QI" (offset, length) entry per record, appended once the record is complete.
+
+Nodes are identified by labels given in order of first use (node0, node1...), as their ports change between runs.
+Requests are matched on node, method, path and body, JSON-RPC ids excluded (the ids of the replayed responses
+are rewritten). Replay follows the recorded timeline: requests with side effects (not idempotent) are served in
+recorded order and move the replay time forward, read-only requests get the next recorded response that does
+not cross a pending side effect, or the latest one before it when the session polls more than the recorded one.
+"""
+
+import json
+import struct
+import threading
+import time
+from bisect import bisect_right
+
+from jsonstream import _value_end, _WHITESPACE
+
+_HEADER = struct.Struct(">II")
+_INDEX_ENTRY = struct.Struct(">QI")
+
+
+class ReplayError(Exception):
+    pass
+
+
+def _text(body):
+    if body is not None and not isinstance(body, type(u"")):
+        body = body.decode('utf8')
+    return body
+
+
+def _request_ids(body):
+    """
+    Return the list of ids of a JSON-RPC request (single or batch), None if body is not a JSON-RPC request.
+    """
+    try:
+        doc = json.loads(body)
+    except (TypeError, ValueError):
+        return None
+    entries = doc if isinstance(doc, list) else [doc]
+    if not entries or not all(isinstance(entry, dict) and "method" in entry for entry in entries):
+        return None
+    return [entry.get("id") for entry in entries]
+
+
+def _request_key(node, method, path, body):
+    if body is not None:
+        try:
+            doc = json.loads(body)
+            for entry in (doc if isinstance(doc, list) else [doc]):
+                if isinstance(entry, dict) and "method" in entry:
+                    entry.pop("id", None)
+            body = json.dumps(doc, sort_keys=True)
+        except ValueError:
+            pass
+    return node, method, path, body
+
+
+def _replace_id(response, request_id):
+    """
+    Replace the value of the top level "id" member of a JSON-RPC response object.
+    """
+    pos = _WHITESPACE.match(response, 1).end()
+    while pos < len(response) and response[pos:pos + 1] != b'}':
+        name_end = _value_end(response, pos)
+        name = response[pos:name_end]
+        value_start = _WHITESPACE.match(response, _WHITESPACE.match(response, name_end).end() + 1).end()
+        value_end = _value_end(response, value_start)
+        if name == b'"id"':
+            return response[:value_start] + json.dumps(request_id).encode('utf8') + response[value_end:]
+        pos = _WHITESPACE.match(response, value_end).end()
+        if response[pos:pos + 1] == b',':
+            pos = _WHITESPACE.match(response, pos + 1).end()
+    return response
+
+
+def _replace_ids(responsedata, ids):
+    """
+    Put the given request ids in a recorded JSON-RPC response, single or batch.
+    """
+    responsedata = responsedata.strip()
+    if not responsedata.startswith(b'['):
+        return _replace_id(responsedata, ids[0])
+    elements = []
+    pos = _WHITESPACE.match(responsedata, 1).end()
+    while pos < len(responsedata) and responsedata[pos:pos + 1] != b']':
+        end = _value_end(responsedata, pos)
+        elements.append(responsedata[pos:end])
+        pos = _WHITESPACE.match(responsedata, end).end()
+        if responsedata[pos:pos + 1] == b',':
+            pos = _WHITESPACE.match(responsedata, pos + 1).end()
+    if len(elements) != len(ids):
+        return responsedata
+    return b'[' + b','.join(_replace_id(element, request_id) for element, request_id in zip(elements, ids)) + b']'
+
+
+class _Traffic(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.__labels = {}
+        self.__labels_lock = threading.Lock()
+
+    def node_label(self, address):
+        """
+        Return the label of the node at address, e.g. "127.0.0.1:8201" -> "node1".
+        """
+        with self.__labels_lock:
+            if address not in self.__labels:
+                self.__labels[address] = "node%d" % len(self.__labels)
+            return self.__labels[address]
+
+
+class TrafficRecorder(_Traffic):
+    replaying = False
+
+    def __init__(self, path):
+        _Traffic.__init__(self, path)
+        self.__data = open(path, "ab")
+        self.__index = open(path + ".idx", "ab")
+        self.__lock = threading.Lock()
+        self.records = self.__index.tell() // _INDEX_ENTRY.size
+
+    def exchange(self, node, method, path, body, idempotent, function):
+        """
+        Run function() returning (status, response body) and record it.
+        """
+        start = time.time()
+        status, responsedata = function()
+        latency = time.time() - start
+        with self.__lock:
+            metadata = json.dumps({"seq": self.records, "node": node, "method": method, "path": path,
+                                   "body": _text(body), "status": status, "latency": latency,
+                                   "idempotent": idempotent}).encode('utf8')
+            offset = self.__data.tell()
+            self.__data.write(_HEADER.pack(len(metadata), len(responsedata)) + metadata + responsedata)
+            self.__data.flush()
+            self.__index.write(_INDEX_ENTRY.pack(offset, _HEADER.size + len(metadata) + len(responsedata)))
+            self.__index.flush()
+            self.records += 1
+        return status, responsedata
+
+    def close(self):
+        with self.__lock:
+            self.__data.close()
+            self.__index.close()
+
+
+class _Record(object):
+
+    def __init__(self, metadata, offset, length):
+        self.seq = metadata["seq"]
+        self.status = metadata["status"]
+        self.latency = metadata["latency"]
+        self.idempotent = metadata["idempotent"]
+        # Of the response body in the traffic file
+        self.offset = offset
+        self.length = length
+
+
+class TrafficReplay(_Traffic):
+    replaying = True
+
+    def __init__(self, path, simulate_latency=False):
+        _Traffic.__init__(self, path)
+        self.simulate_latency = simulate_latency
+        self.__data = open(path, "rb")
+        self.__lock = threading.Lock()
+        self.__by_key = {}  # request key -> records, in recorded order
+        self.__served = {}  # request key -> count of served non idempotent records
+        self.__pending = []  # seqs of the non idempotent records not served yet
+        self.__now = -1  # seq of the last side effect or of the last served response
+        self.records = 0
+        with open(path + ".idx", "rb") as index:
+            entries = index.read()
+        for pos in range(0, len(entries) - len(entries) % _INDEX_ENTRY.size, _INDEX_ENTRY.size):
+            offset, length = _INDEX_ENTRY.unpack_from(entries, pos)
+            self.__data.seek(offset)
+            metadata_length, response_length = _HEADER.unpack(self.__data.read(_HEADER.size))
+            metadata = json.loads(self.__data.read(metadata_length).decode('utf8'))
+            record = _Record(metadata, offset + _HEADER.size + metadata_length, response_length)
+            key = _request_key(metadata["node"], metadata["method"], metadata["path"], metadata["body"])
+            self.__by_key.setdefault(key, []).append(record)
+            if not record.idempotent:
+                self.__pending.append(record.seq)
+            self.records += 1
+        self.__pending.sort()
+
+    def _select(self, key, idempotent):
+        records = self.__by_key.get(key)
+        if not records:
+            raise ReplayError("No recorded response for %s %s %s on %s" % (key[1], key[2], key[3], key[0]))
+        if not idempotent:
+            served = self.__served.get(key, 0)
+            if served >= len(records):
+                raise ReplayError("Request %s %s %s on %s sent more times than recorded"
+                                  % (key[1], key[2], key[3], key[0]))
+            self.__served[key] = served + 1
+            record = records[served]
+            self.__pending.remove(record.seq)
+            self.__now = max(self.__now, record.seq)
+            return record
+        seqs = [recorded.seq for recorded in records]
+        position = bisect_right(seqs, self.__now)
+        barrier_position = bisect_right(self.__pending, self.__now)
+        barrier = self.__pending[barrier_position] if barrier_position < len(self.__pending) else None
+        if position < len(records) and (barrier is None or records[position].seq < barrier or position == 0):
+            record = records[position]
+            if barrier is None or record.seq < barrier:
+                self.__now = record.seq
+            return record
+        return records[position - 1]
+
+    def exchange(self, node, method, path, body, idempotent, function):
+        """
+        Return the recorded (status, response body) of the request, without calling function.
+        """
+        body = _text(body)
+        with self.__lock:
+            record = self._select(_request_key(node, method, path, body), idempotent)
+            self.__data.seek(record.offset)
+            responsedata = self.__data.read(record.length)
+        if self.simulate_latency:
+            time.sleep(record.latency)
+        ids = _request_ids(body) if body is not None else None
+        if ids is not None:
+            responsedata = _replace_ids(responsedata, ids)
+        return record.status, responsedata
+
+    def close(self):
+        with self.__lock:
+            self.__data.close()
+
+
+_shared_traffic = None
+
+
+def enable_recording(path):
+    global _shared_traffic
+    _shared_traffic = TrafficRecorder(path)
+    return _shared_traffic
+
+
+def enable_replay(path, simulate_latency=False):
+    global _shared_traffic
+    _shared_traffic = TrafficReplay(path, simulate_latency)
+    return _shared_traffic
+
+
+def get_traffic():
+    """
+    Return the recorder or replay used by the nodes started by the framework, None if neither is enabled.
+    """
+    return _shared_traffic
+
+
+def is_replaying():
+    return _shared_traffic is not None and _shared_traffic.replaying
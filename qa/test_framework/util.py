@@ -17,11 +17,21 @@ from decimal import Decimal, ROUND_DOWN
 import json
 import random
 import shutil
+import socket
 import subprocess
 import time
-import re
-
-from authproxy import AuthServiceProxy
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+
+from authproxy import AuthServiceProxy, JSONRPCBatch, JSONRPCException
+from callstats import WAIT_STATS
+from jsoncodec import DECIMAL_CODEC, INTEGER_CODEC
+from responsecache import get_response_cache
+from traffic import get_traffic, is_replaying
+from wait import wait_until, wait_for_agreement, wait_for_same_ids, poll_concurrently, TimeoutException
+from websocketclient import TipListener, WebSocketError
 
 def p2p_port(n):
     return 11000 + n + os.getpid()%999
@@ -36,6 +46,10 @@ def check_json_precision():
     satoshis = int(json.loads(json.dumps(float(n)))*1.0e8)
     if satoshis != 2000000000000003:
         raise RuntimeError("JSON encode/decode loses precision")
+    if DECIMAL_CODEC.decode(b"[20000000.00000003]")[0] != n:
+        raise RuntimeError("JSON codec %s (%s) loses precision" % (DECIMAL_CODEC.name, DECIMAL_CODEC.backend))
+    if INTEGER_CODEC.decode(b"[2000000000000003]")[0] != 2000000000000003:
+        raise RuntimeError("JSON codec %s (%s) loses precision" % (INTEGER_CODEC.name, INTEGER_CODEC.backend))
 
 def bytes_to_hex_str(byte_str):
     return hexlify(byte_str).decode('ascii')
@@ -46,32 +60,46 @@ def hex_str_to_bytes(hex_str):
 def str_to_b64str(string):
     return b64encode(string.encode('utf-8')).decode('ascii')
 
-def sync_blocks(rpc_connections, wait=1):
+def batch_call(node, method, params_list):
+    """
+    Call method on node once for every params tuple in params_list using JSON-RPC batches.
+    Return the list of results in the same order, raise JSONRPCException for the first failed call.
+    """
+    batch = JSONRPCBatch(node)
+    ids = [batch.add(method, *params) for params in params_list]
+    batch.execute()
+    return [batch.result(request_id) for request_id in ids]
+
+def drop_chain_dependent_responses():
     """
-    Wait until everybody has the same block count
+    Drop the cached responses depending on the chain tip (see responsecache.py): the chain of some node may have
+    changed, e.g. by syncing blocks mined elsewhere or by a reorg.
     """
-    while True:
-        counts = [ x.getblockcount() for x in rpc_connections ]
-        if counts == [ counts[0] ]*len(counts):
-            break
-        time.sleep(wait)
+    cache = get_response_cache()
+    if cache is not None:
+        cache.invalidate_volatile()
 
-def sync_mempools(rpc_connections, wait=1):
+def sync_blocks(rpc_connections, wait_for=60, max_delay=None):
     """
-    Wait until everybody has the same transactions in their memory
-    pools
+    Wait for maximum wait_for seconds for everybody to have the same block count, querying the nodes concurrently.
+    Return the elapsed seconds.
     """
-    while True:
-        pool = set(rpc_connections[0].getrawmempool())
-        num_match = 1
-        for i in range(1, len(rpc_connections)):
-            if set(rpc_connections[i].getrawmempool()) == pool:
-                num_match = num_match+1
-        if num_match == len(rpc_connections):
-            break
-        time.sleep(wait)
+    try:
+        return wait_for_agreement(rpc_connections, lambda x: x.getblockcount(), wait_for, "Syncing MC blocks",
+                                  target=max, max_delay=max_delay)
+    finally:
+        drop_chain_dependent_responses()
+
+def sync_mempools(rpc_connections, wait_for=60, max_delay=None):
+    """
+    Wait for maximum wait_for seconds for everybody to have the same transactions in their memory
+    pools, querying the nodes concurrently. Return the elapsed seconds.
+    """
+    return wait_for_same_ids(rpc_connections, lambda x: x.getrawmempool(), wait_for, "Syncing MC mempools",
+                             "transactions", max_delay)
 
 bitcoind_processes = {}
+mc_tip_listeners = {}
 
 def initialize_datadir(dirname, n, websocket_port=None):
     datadir = os.path.join(dirname, "node"+str(n))
@@ -95,11 +123,10 @@ def initialize_chain(test_dir):
     """
     Create (or copy from cache) a 200-block-long chain and
     4 wallets.
-    bitcoind and bitcoin-cli must be in search path.
+    bitcoind must be in search path.
     """
 
     if not os.path.isdir(os.path.join("cache", "node0")):
-        devnull = open("/dev/null", "w+")
         # Create cache directories, run bitcoinds:
         for i in range(4):
             datadir=initialize_datadir("cache", i, [])
@@ -108,12 +135,10 @@ def initialize_chain(test_dir):
                 args.append("-connect=127.0.0.1:"+str(p2p_port(0)))
             bitcoind_processes[i] = subprocess.Popen(args)
             if os.getenv("PYTHON_DEBUG", ""):
-                print "initialize_chain: bitcoind started, calling bitcoin-cli -rpcwait getblockcount"
-            subprocess.check_call([ os.getenv("BITCOINCLI", "bitcoin-cli"), "-datadir="+datadir,
-                                    "-rpcwait", "getblockcount"], stdout=devnull)
+                print "initialize_chain: bitcoind started, waiting for its RPC server"
+            wait_for_rpc(i)
             if os.getenv("PYTHON_DEBUG", ""):
-                print "initialize_chain: bitcoin-cli -rpcwait getblockcount completed"
-        devnull.close()
+                print "initialize_chain: RPC server ready"
         rpcs = []
         for i in range(4):
             try:
@@ -160,74 +185,145 @@ def initialize_chain_clean(test_dir, num_nodes):
     for i in range(num_nodes):
         initialize_datadir(test_dir, i, websocket_port_by_mc_node_index(i))
 
-def _rpchost_to_args(rpchost):
-    '''Convert optional IP:port spec to rpcconnect/rpcport args'''
-    if rpchost is None:
-        return []
-
-    match = re.match('(\[[0-9a-fA-f:]+\]|[^:]+)(?::([0-9]+))?$', rpchost)
-    if not match:
-        raise ValueError('Invalid RPC host spec ' + rpchost)
-
-    rpcconnect = match.group(1)
-    rpcport = match.group(2)
-
-    if rpcconnect.startswith('['): # remove IPv6 [...] wrapping
-        rpcconnect = rpcconnect[1:-1]
-
-    rv = ['-rpcconnect=' + rpcconnect]
-    if rpcport:
-        rv += ['-rpcport=' + rpcport]
-    return rv
-
-def start_node(i, dirname, extra_args=None, rpchost=None, timewait=None, binary=None):
+def _launch_node(i, dirname, extra_args=None, binary=None):
     """
-    Start a bitcoind and return RPC connection to it
+    Start the bitcoind process of node i, without waiting for it. Return its datadir.
     """
     datadir = os.path.join(dirname, "node"+str(i))
     if binary is None:
         binary = os.getenv("BITCOIND", "bitcoind")
     args = [ binary, "-datadir="+datadir, "-keypool=1", "-discover=0", "-rest", "-websocket"]
     if extra_args is not None: args.extend(extra_args)
-    bitcoind_processes[i] = subprocess.Popen(args)
-    devnull = open(os.devnull, "w+")
-    if os.getenv("PYTHON_DEBUG", ""):
-        print "start_node: bitcoind started, calling bitcoin-cli -rpcwait getblockcount"
-    subprocess.check_call([ os.getenv("BITCOINCLI", "bitcoin-cli"), "-datadir="+datadir] +
-                          _rpchost_to_args(rpchost)  +
-                          ["-rpcwait", "getblockcount"], stdout=devnull)
-    if os.getenv("PYTHON_DEBUG", ""):
-        print "start_node: calling bitcoin-cli -rpcwait getblockcount returned"
-    devnull.close()
+    if not is_replaying():
+        bitcoind_processes[i] = subprocess.Popen(args)
+    return datadir
+
+# RPC error code of zend while starting: loading block index, verifying blocks...
+RPC_IN_WARMUP = -28
+
+def wait_for_rpc(i, rpchost=None, wait_for=60):
+    """
+    Wait for maximum wait_for seconds until the RPC server of node i answers. Refused connections and warmup
+    errors are retried with the adaptive delays of wait.py, an exit of the bitcoind process fails right away.
+    """
+    proxy = AuthServiceProxy("http://rt:rt@%s:%d" % (rpchost or '127.0.0.1', rpc_port(i)))
+    def rpc_ready():
+        if i in bitcoind_processes and bitcoind_processes[i].poll() is not None:
+            raise RuntimeError("node%d exited with code %d during initialization"
+                               % (i, bitcoind_processes[i].returncode))
+        try:
+            proxy.getblockcount()
+        except JSONRPCException as e:
+            if e.error['code'] != RPC_IN_WARMUP:
+                raise
+            return False
+        except (socket.error, httplib.HTTPException):
+            # Not listening yet
+            return False
+        return True
+    return wait_until(rpc_ready, wait_for, "Waiting node%d RPC server" % i)
+
+def _wait_for_node(i, datadir, rpchost=None, since=None):
+    """
+    Wait until the RPC server of node i answers, then listen to its tip events.
+    Return the seconds since the node was launched (since), also recorded as "READY MC node".
+    """
+    if since is None:
+        since = time.time()
+    if not is_replaying():
+        if os.getenv("PYTHON_DEBUG", ""):
+            print "start_node: bitcoind started, waiting for its RPC server"
+        wait_for_rpc(i, rpchost)
+        if os.getenv("PYTHON_DEBUG", ""):
+            print "start_node: RPC server ready"
+        start_tip_listener(i, datadir)
+    ready = time.time() - since
+    WAIT_STATS.record("READY MC node", ready)
+    return ready
+
+def _node_proxy(i, rpchost=None, timewait=None):
     url = "http://rt:rt@%s:%d" % (rpchost or '127.0.0.1', rpc_port(i))
     if timewait is not None:
-        proxy = AuthServiceProxy(url, timeout=timewait)
+        proxy = AuthServiceProxy(url, timeout=timewait, cache=get_response_cache(), traffic=get_traffic())
     else:
-        proxy = AuthServiceProxy(url)
+        proxy = AuthServiceProxy(url, cache=get_response_cache(), traffic=get_traffic())
     proxy.url = url # store URL on proxy for info
     return proxy
 
+def start_node(i, dirname, extra_args=None, rpchost=None, timewait=None, binary=None):
+    """
+    Start a bitcoind and return RPC connection to it
+    """
+    datadir = _launch_node(i, dirname, extra_args, binary)
+    _wait_for_node(i, datadir, rpchost)
+    return _node_proxy(i, rpchost, timewait)
+
+def _websocket_port(datadir):
+    with open(os.path.join(datadir, "zen.conf")) as f:
+        for line in f:
+            if line.startswith("wsport="):
+                try:
+                    return int(line[len("wsport="):])
+                except ValueError:
+                    return None
+    return None
+
+def start_tip_listener(i, datadir):
+    """
+    Listen to the tip update events of node i, if its websocket port is known, see websocketclient.py.
+    Without them the helpers just poll.
+    """
+    port = _websocket_port(datadir)
+    if port is None:
+        return None
+    try:
+        mc_tip_listeners[i] = TipListener('127.0.0.1', port, on_tip=lambda event: drop_chain_dependent_responses())
+    except (socket.error, WebSocketError) as e:
+        if os.getenv("PYTHON_DEBUG", ""):
+            print "start_node: no websocket events from node%d: %s" % (i, e)
+        return None
+    return mc_tip_listeners[i]
+
+def stop_tip_listener(i):
+    listener = mc_tip_listeners.pop(i, None)
+    if listener is not None:
+        listener.close()
+
 def start_nodes(num_nodes, dirname, extra_args=None, rpchost=None, binary=None):
     """
-    Start multiple bitcoinds, return RPC connections to them
+    Start multiple bitcoinds, return RPC connections to them.
+    All the processes are launched first, then waited for concurrently.
     """
     if extra_args is None: extra_args = [ None for i in range(num_nodes) ]
     if binary is None: binary = [ None for i in range(num_nodes) ]
-    return [ start_node(i, dirname, extra_args[i], rpchost, binary=binary[i]) for i in range(num_nodes) ]
+    start = time.time()
+    datadirs = [ _launch_node(i, dirname, extra_args[i], binary[i]) for i in range(num_nodes) ]
+    ready = poll_concurrently(lambda i: _wait_for_node(i, datadirs[i], rpchost, start), list(range(num_nodes)))
+    if num_nodes > 0 and not is_replaying():
+        print("MC nodes ready in %.3fs: %s" % (max(ready), ", ".join("node%d %.3fs" % (i, ready[i])
+                                                                       for i in range(num_nodes))))
+    return [ _node_proxy(i, rpchost) for i in range(num_nodes) ]
 
 def log_filename(dirname, n_node, logname):
     return os.path.join(dirname, "node"+str(n_node), "regtest", logname)
 
 def check_node(i):
+    if is_replaying():
+        return None
     bitcoind_processes[i].poll()
     return bitcoind_processes[i].returncode
 
 def stop_node(node, i):
+    stop_tip_listener(i)
     node.stop()
+    if is_replaying():
+        return
     bitcoind_processes[i].wait()
     del bitcoind_processes[i]
 
 def stop_nodes(nodes):
+    for i in list(mc_tip_listeners):
+        stop_tip_listener(i)
     for node in nodes:
         node.stop()
     del nodes[:] # Emptying array closes connections as a side effect
@@ -242,13 +338,49 @@ def wait_bitcoinds():
         bitcoind.wait()
     bitcoind_processes.clear()
 
+def wait_for_version_handshake(from_connection, wait_for=60):
+    """
+    Wait until the version handshake with every peer of from_connection is complete.
+    """
+    return wait_until(lambda: not any(peer['version'] == 0 for peer in from_connection.getpeerinfo()),
+                      wait_for, "MC version handshake")
+
 def connect_nodes(from_connection, node_num):
     ip_port = "127.0.0.1:"+str(p2p_port(node_num))
     from_connection.addnode(ip_port, "onetry")
     # poll until version handshake complete to avoid race conditions
     # with transaction relaying
-    while any(peer['version'] == 0 for peer in from_connection.getpeerinfo()):
-        time.sleep(0.1)
+    wait_for_version_handshake(from_connection)
+    # The node may switch to the longer chain of its new peer
+    drop_chain_dependent_responses()
+
+def connect_topology(nodes, edges, wait_for=60):
+    """
+    Connect the MC nodes along edges, pairs (a, b) of node numbers, a connecting to b: all the connections are
+    requested concurrently, then a single wait until every edge is confirmed on both ends (a has completed the
+    version handshake with b, b with as many inbound peers as it has incoming edges). Return the total connect time.
+    """
+    start = time.time()
+    poll_concurrently(lambda edge: nodes[edge[0]].addnode("127.0.0.1:"+str(p2p_port(edge[1])), "onetry"),
+                      list(edges))
+    outbound = dict((i, set()) for i in range(len(nodes)))
+    inbound = dict((i, 0) for i in range(len(nodes)))
+    for (a, b) in edges:
+        outbound[a].add("127.0.0.1:"+str(p2p_port(b)))
+        inbound[b] += 1
+
+    def confirmed(i):
+        if not outbound[i] and not inbound[i]:
+            return True
+        peers = [peer for peer in nodes[i].getpeerinfo() if peer['version'] != 0]
+        connected = set(peer['addr'] for peer in peers if not peer['inbound'])
+        return outbound[i] <= connected and len([peer for peer in peers if peer['inbound']]) >= inbound[i]
+    wait_until(lambda: all(poll_concurrently(confirmed, list(range(len(nodes))))), wait_for,
+               "Connecting %d MC node edges" % len(edges))
+    drop_chain_dependent_responses()
+    elapsed = time.time() - start
+    print("Connected %d MC node edges in %.3fs" % (len(edges), elapsed))
+    return elapsed
 
 def connect_nodes_bi(nodes, a, b):
     connect_nodes(nodes[a], b)
@@ -259,8 +391,7 @@ def disconnect_nodes(from_connection, node_num):
     from_connection.disconnectnode(ip_port)
     # poll until version handshake complete to avoid race conditions
     # with transaction relaying
-    while any(peer['version'] == 0 for peer in from_connection.getpeerinfo()):
-        time.sleep(0.1)
+    wait_for_version_handshake(from_connection)
 
 def disconnect_nodes_bi(nodes, a, b):
     disconnect_nodes(nodes[a], b)
@@ -409,13 +540,15 @@ def fail(message=""):
 # Returns an async operation result
 def wait_and_assert_operationid_status_result(node, myopid, in_status='success', in_errormsg=None, timeout=300):
     print('waiting for async operation {}'.format(myopid))
-    result = None
-    for _ in xrange(1, timeout):
-        results = node.z_getoperationresult([myopid])
-        if len(results) > 0:
-            result = results[0]
-            break
-        time.sleep(1)
+    results = []
+    def has_result():
+        results[:] = node.z_getoperationresult([myopid])
+        return len(results) > 0
+    try:
+        wait_until(has_result, timeout, "Waiting async operation result", max_delay=1)
+    except TimeoutException:
+        pass
+    result = results[0] if results else None
 
     assert_true(result is not None, "timeout occured")
     status = result['status']
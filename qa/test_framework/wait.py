@@ -0,0 +1,231 @@
+"""
+Adaptive waiting for a condition on the nodes, the base of the sync and wait helpers.
+
+wait_until evaluates a predicate right away, then again after delays growing from INITIAL_DELAY up to a ceiling
+(MAX_DELAY by default, see set_max_delay), until it holds or the timeout expires. Most syncs between local nodes
+complete in a few tens of milliseconds, and are detected as such instead of costing a fixed polling interval.
+
+Sources of push notifications (e.g. the tip events of websocketclient.TipListener) call notify_progress, which
+cuts short the delays of the waits in progress: their predicates are evaluated again right away.
+
+The time taken by every wait is returned and recorded in WAIT_STATS (see callstats.py) as "WAIT <operation>",
+timeouts counted apart.
+The timeout is also an overall deadline for the node API calls made by the predicate (see deadline.py). The
+predicate is not evaluated with less than MIN_ATTEMPT_TIME left, and a request of the predicate given up because
+the deadline expired ends the wait with the TimeoutException, not with the error of the request.
+
+wait_for_agreement queries all the nodes concurrently at each round, so that a round costs the slowest node
+instead of the sum of all of them, and reports the nodes that lagged behind: how long each one took to catch
+up is recorded as "LAG <operation> <node>", the nodes still lagging are listed in the TimeoutException.
+wait_for_same_ids does the same for sets of ids (mempools), listing the ids missing and extra on every node.
+"""
+
+import socket
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from callstats import WAIT_STATS
+from deadline import within, current_deadline, using, RequestTimeout
+
+INITIAL_DELAY = 0.005
+BACKOFF = 2.0
+MAX_DELAY = 0.5
+MIN_ATTEMPT_TIME = 0.05
+POLL_THREADS = 16
+
+
+class TimeoutException(Exception):
+    def __init__(self, operation, elapsed=None, details=None):
+        message = operation
+        if elapsed is not None:
+            message += " (gave up after %.3fs)" % elapsed
+        if details:
+            message += ": " + details
+        Exception.__init__(self, message)
+        self.operation = operation
+        self.elapsed = elapsed
+        self.details = details
+
+
+_progress = threading.Condition()
+_progress_count = 0
+
+
+def notify_progress():
+    """
+    Wake up the waits in progress, the state of the nodes may have changed.
+    """
+    global _progress_count
+    with _progress:
+        _progress_count += 1
+        _progress.notify_all()
+
+
+def _sleep(seconds, seen):
+    """
+    Sleep for seconds, or until notify_progress is called if it was not since the seen count.
+    """
+    end = time.time() + seconds
+    with _progress:
+        while _progress_count == seen:
+            remaining = end - time.time()
+            if remaining <= 0:
+                break
+            _progress.wait(remaining)
+        return _progress_count
+
+
+def set_max_delay(seconds):
+    """
+    Set the default ceiling of the delay between two evaluations of a wait predicate.
+    """
+    global MAX_DELAY
+    MAX_DELAY = seconds
+
+
+def _timed_out(operation, start):
+    elapsed = time.time() - start
+    WAIT_STATS.record("WAIT " + operation, elapsed, timeout=True)
+    raise TimeoutException(operation, elapsed)
+
+
+def wait_until(predicate, timeout, operation, max_delay=None):
+    """
+    Wait for maximum timeout seconds (None meaning forever) for predicate() to return a true value, with growing
+    delays between the attempts. Return the elapsed seconds, raise TimeoutException(operation) on timeout.
+    """
+    if max_delay is None:
+        max_delay = MAX_DELAY
+    start = time.time()
+    delay = INITIAL_DELAY
+    with within(timeout, operation) as deadline:
+        seen = _progress_count
+        while True:
+            try:
+                if predicate():
+                    break
+            except (socket.timeout, RequestTimeout):
+                # Given up on the deadline rather than on the timeout of its route: the wait timed out
+                if deadline is None or deadline.remaining() >= MIN_ATTEMPT_TIME:
+                    raise
+                _timed_out(operation, start)
+            sleep = min(delay, max_delay)
+            if deadline is not None:
+                sleep = min(sleep, deadline.remaining())
+            seen = _sleep(sleep, seen)
+            delay *= BACKOFF
+            # Not evaluating the predicate again with no time left, its requests would fail with a less clear error
+            if deadline is not None and deadline.remaining() < MIN_ATTEMPT_TIME:
+                _timed_out(operation, start)
+    elapsed = time.time() - start
+    WAIT_STATS.record("WAIT " + operation, elapsed)
+    return elapsed
+
+
+_poll_pool = None
+_poll_pool_lock = threading.Lock()
+
+
+def poll_concurrently(function, nodes):
+    """
+    Return [function(node) for node in nodes], calling function concurrently under the deadline of the caller.
+    The first exception raised by a call is raised.
+    """
+    global _poll_pool
+    if len(nodes) <= 1:
+        return [function(node) for node in nodes]
+    with _poll_pool_lock:
+        if _poll_pool is None:
+            _poll_pool = ThreadPool(POLL_THREADS)
+    deadline = current_deadline()
+
+    def call(node):
+        with using(deadline):
+            return function(node)
+    return _poll_pool.map(call, nodes)
+
+
+def wait_for_agreement(nodes, query, timeout, operation, target=None, describe=str, max_delay=None):
+    """
+    Wait for maximum timeout seconds until query(node) returns the same value for all the nodes, querying them
+    concurrently at each round. A node lags while its value differs from target(values) (values[0] by default),
+    describe(value) tells where a lagging node is in the TimeoutException. Return the elapsed seconds.
+    """
+    if target is None:
+        target = lambda values: values[0]
+    lag_start = {}
+    state = {}
+
+    def agreed():
+        values = poll_concurrently(query, nodes)
+        expected = target(values)
+        now = time.time()
+        for i, value in enumerate(values):
+            if value != expected:
+                lag_start.setdefault(i, now)
+            elif i in lag_start:
+                WAIT_STATS.record("LAG %s node%d" % (operation, i), now - lag_start.pop(i))
+        state["values"], state["expected"] = values, expected
+        return all(value == values[0] for value in values)
+
+    try:
+        return wait_until(agreed, timeout, operation, max_delay)
+    except TimeoutException as e:
+        now = time.time()
+        lagging = []
+        for i in sorted(lag_start):
+            WAIT_STATS.record("LAG %s node%d" % (operation, i), now - lag_start[i], timeout=True)
+            lagging.append("node%d at %s for %.3fs" % (i, describe(state["values"][i]), now - lag_start[i]))
+        if lagging:
+            e = TimeoutException(operation, e.elapsed,
+                                 "%s, expected %s" % (", ".join(lagging), describe(state["expected"])))
+        raise e
+
+
+def _some(ids, count=5):
+    ids = sorted(ids)
+    return ", ".join(ids[:count]) + (", ..." if len(ids) > count else "")
+
+
+def wait_for_same_ids(nodes, query, timeout, operation, what="ids", max_delay=None):
+    """
+    Wait for maximum timeout seconds until query(node) returns the same set of ids (e.g. of the mempool transactions)
+    for all the nodes, querying them concurrently at each round. The ids of a node are turned into a set, and its
+    missing and extra ids with respect to the first node computed, only when they changed since the previous round,
+    so rounds stay cheap with thousands of ids. Return the elapsed seconds.
+    """
+    known = [None] * len(nodes)  # (ids as returned, set of them) of every node
+    diffs = [None] * len(nodes)  # (reference set, node set, missing ids, extra ids) of every node
+    lag_start = {}
+
+    def ids_of(i):
+        ids = query(nodes[i])
+        if known[i] is None or known[i][0] != ids:
+            known[i] = (ids, frozenset(ids))
+        return known[i][1]
+
+    def same_ids():
+        sets = poll_concurrently(ids_of, list(range(len(nodes))))
+        now = time.time()
+        for i in range(1, len(nodes)):
+            diff = diffs[i]
+            if diff is None or diff[0] is not sets[0] or diff[1] is not sets[i]:
+                diff = diffs[i] = (sets[0], sets[i], sets[0] - sets[i], sets[i] - sets[0])
+            if diff[2] or diff[3]:
+                lag_start.setdefault(i, now)
+            elif i in lag_start:
+                WAIT_STATS.record("LAG %s node%d" % (operation, i), now - lag_start.pop(i))
+        return not lag_start
+
+    try:
+        return wait_until(same_ids, timeout, operation, max_delay)
+    except TimeoutException as e:
+        now = time.time()
+        lagging = []
+        for i in sorted(lag_start):
+            WAIT_STATS.record("LAG %s node%d" % (operation, i), now - lag_start[i], timeout=True)
+            missing, extra = diffs[i][2], diffs[i][3]
+            lagging.append("node%d missing %d %s [%s], %d extra [%s] for %.3fs"
+                           % (i, len(missing), what, _some(missing), len(extra), _some(extra), now - lag_start[i]))
+        raise TimeoutException(operation, e.elapsed, ", ".join(lagging))
@@ -0,0 +1,244 @@
+"""
+Minimal websocket client (RFC 6455) for the events pushed by zend on its -websocket port.
+
+zend pushes a tip update event to every connected client when its best block changes:
+
+    {"msgType": 0, "eventType": 0, "eventPayload": {"height": 220, "hash": "0e3c...", "block": "0400..."}}
+
+TipListener reads them on a background thread and keeps them with their arrival time, so a test can wait for a
+given height or measure when a block was announced. Every event also wakes up the waits in progress
+(wait.notify_progress), so sync_blocks and the other helpers re-check the nodes at once instead of at their next
+poll. start_node attaches a TipListener to every node whose zen.conf sets wsport (see mc_tip_listeners).
+"""
+
+import base64
+import hashlib
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from wait import notify_progress, TimeoutException
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+MSG_TYPE_EVENT = 0
+EVENT_UPDATE_TIP = 0
+
+
+class WebSocketError(Exception):
+    pass
+
+
+class WebSocketClient(object):
+
+    def __init__(self, host, port, path="/", timeout=10):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.__file = self.sock.makefile('rb')
+        self.__send_lock = threading.Lock()
+        self.closed = False
+        try:
+            self._handshake(host, port, path)
+        except Exception:
+            self.sock.close()
+            raise
+        self.sock.settimeout(None)
+
+    def _handshake(self, host, port, path):
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        request = ("GET %s HTTP/1.1\r\n"
+                   "Host: %s:%d\r\n"
+                   "Upgrade: websocket\r\n"
+                   "Connection: Upgrade\r\n"
+                   "Sec-WebSocket-Key: %s\r\n"
+                   "Sec-WebSocket-Version: 13\r\n\r\n") % (path, host, port, key)
+        self.sock.sendall(request.encode('ascii'))
+        status = self.__file.readline()
+        if status.split()[1:2] != [b'101']:
+            raise WebSocketError("Websocket handshake refused: %r" % status.strip())
+        headers = {}
+        while True:
+            line = self.__file.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.partition(b':')
+            headers[name.strip().lower()] = value.strip()
+        accept = base64.b64encode(hashlib.sha1((key + GUID).encode('ascii')).digest())
+        if headers.get(b'sec-websocket-accept') != accept:
+            raise WebSocketError("Invalid Sec-WebSocket-Accept in the handshake response")
+
+    def send(self, payload, opcode=OP_TEXT):
+        """
+        Send a message in a single masked frame, as clients must.
+        """
+        if not isinstance(payload, bytes):
+            payload = payload.encode('utf8')
+        header = bytearray([0x80 | opcode])
+        if len(payload) < 126:
+            header.append(0x80 | len(payload))
+        elif len(payload) < 1 << 16:
+            header.append(0x80 | 126)
+            header += struct.pack(">H", len(payload))
+        else:
+            header.append(0x80 | 127)
+            header += struct.pack(">Q", len(payload))
+        mask = bytearray(os.urandom(4))
+        masked = bytearray(payload)
+        for i in range(len(masked)):
+            masked[i] ^= mask[i % 4]
+        with self.__send_lock:
+            self.sock.sendall(bytes(header + mask + masked))
+
+    def _read(self, size):
+        data = self.__file.read(size)
+        if len(data) < size:
+            raise EOFError()
+        return data
+
+    def _frame(self):
+        first, second = bytearray(self._read(2))
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack(">H", self._read(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", self._read(8))[0]
+        mask = bytearray(self._read(4)) if second & 0x80 else None
+        payload = self._read(length)
+        if mask is not None:
+            payload = bytearray(payload)
+            for i in range(len(payload)):
+                payload[i] ^= mask[i % 4]
+            payload = bytes(payload)
+        return bool(first & 0x80), first & 0x0F, payload
+
+    def receive(self):
+        """
+        Return (opcode, payload) of the next data message, reassembling fragments and answering pings,
+        None once the connection is closed.
+        """
+        message_opcode, fragments = None, []
+        try:
+            while True:
+                fin, opcode, payload = self._frame()
+                if opcode == OP_PING:
+                    self.send(payload, OP_PONG)
+                elif opcode == OP_PONG:
+                    pass
+                elif opcode == OP_CLOSE:
+                    if not self.closed:
+                        self.closed = True
+                        self.send(payload[:2], OP_CLOSE)
+                    return None
+                else:
+                    if opcode != OP_CONTINUATION:
+                        message_opcode = opcode
+                    fragments.append(payload)
+                    if fin:
+                        return message_opcode, b''.join(fragments)
+        except (EOFError, socket.error, ValueError):
+            # ValueError: read on the file of a socket closed meanwhile
+            self.closed = True
+            return None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.send(struct.pack(">H", 1000), OP_CLOSE)
+            except socket.error:
+                pass
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+
+
+TipEvent = namedtuple("TipEvent", ["height", "hash", "time"])
+
+
+class TipListener(object):
+    """
+    Collect the tip update events of a zend node, with their arrival time. on_tip(event) is called on the listener
+    thread for every event.
+    """
+
+    def __init__(self, host, port, timeout=10, on_tip=None):
+        self.host = host
+        self.port = port
+        self.__on_tip = on_tip
+        self.events = []  # TipEvent, in order of arrival
+        self.__condition = threading.Condition()
+        self.__client = WebSocketClient(host, port, timeout=timeout)
+        self.__thread = threading.Thread(target=self._run, name="TipListener-%d" % port)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def _run(self):
+        while True:
+            message = self.__client.receive()
+            if message is None:
+                break
+            opcode, payload = message
+            if opcode != OP_TEXT:
+                continue
+            try:
+                doc = json.loads(payload.decode('utf8'))
+            except ValueError:
+                continue
+            if doc.get("msgType") == MSG_TYPE_EVENT and doc.get("eventType") == EVENT_UPDATE_TIP:
+                tip = doc["eventPayload"]
+                event = TipEvent(tip["height"], tip["hash"], time.time())
+                with self.__condition:
+                    self.events.append(event)
+                    self.__condition.notify_all()
+                if self.__on_tip is not None:
+                    self.__on_tip(event)
+                notify_progress()
+        with self.__condition:
+            self.__condition.notify_all()
+
+    def last_tip(self):
+        """
+        Return the latest TipEvent, None if none was received yet.
+        """
+        with self.__condition:
+            return self.events[-1] if self.events else None
+
+    def wait_for_event(self, predicate, timeout=60, operation="Waiting MC tip event", since=0):
+        """
+        Wait for maximum timeout seconds for a TipEvent satisfying predicate, among the events from index since.
+        Return it, raise TimeoutException on timeout or when the connection is closed.
+        """
+        start = time.time()
+        with self.__condition:
+            while True:
+                for event in self.events[since:]:
+                    if predicate(event):
+                        return event
+                since = max(since, len(self.events))
+                remaining = start + timeout - time.time()
+                if remaining <= 0 or self.__client.closed:
+                    raise TimeoutException(operation, time.time() - start)
+                self.__condition.wait(remaining)
+
+    def wait_for_height(self, height, timeout=60):
+        """
+        Wait for the tip to reach height, return the TipEvent announcing it.
+        """
+        return self.wait_for_event(lambda event: event.height >= height, timeout,
+                                   "Waiting MC tip at height %d" % height)
+
+    def close(self):
+        self.__client.close()
+        self.__thread.join(5)